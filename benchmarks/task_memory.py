@@ -0,0 +1,95 @@
+import os
+import sys
+import gc
+import json
+import random
+import tempfile
+import tracemalloc
+from datetime import datetime as dt, timedelta as td
+
+sys.path.append("../src")
+SRC = os.path.abspath(sys.path[-1])
+
+from core.task.task_control import TaskManager  # noqa: E402
+from core.task.task_record import RECORD_VERSION, to_epoch  # noqa: E402
+from core.system import IPC  # noqa: E402
+from core.database import Data, ConfigManager  # noqa: E402
+
+
+def make_records(n: int) -> list:
+    # reminders as they are read from the store, all due within the next day
+    now = dt.now()
+    records = []
+    for i in range(n):
+        records.append({"version": RECORD_VERSION,
+                        "basic": {"author_id": random.randint(0, 1000),
+                                  "channel_id": random.randint(0, 10 ** 18),
+                                  "server_id": None,
+                                  "date_string": random.choice(["1h", "30m", "0 8 * * *", "*/5 * * * *"]),
+                                  "number": 0,
+                                  "label": "label",
+                                  "message": "message",
+                                  "message_args": ""},
+                        "extra": {"id": i + 1,
+                                  "type": "Reminder",
+                                  "creation_time": to_epoch(now),
+                                  "next_time": to_epoch(now + td(seconds=random.randint(1, 86400))),
+                                  "delete": False,
+                                  "label": "label",
+                                  "counter": -1}})
+    # every record gets its own objects, like after json.load
+    return json.loads(json.dumps(records))
+
+
+def object_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def create_manager(storage: str) -> TaskManager:
+    config = ConfigManager()
+    config.set_default_config("taskStorage", "Tasks", storage)
+    config.set_config("taskStorage", "Tasks", storage)
+    tm = TaskManager(Data(), IPC(), config)
+    tm.paths = {f"{SRC}/tasks": "tasks"}
+    tm.register_all_tasks()
+    return tm
+
+
+def bench_manager(n: int, storage: str) -> tuple:
+    # the tasks are saved first and measured, as they are loaded at start, together with the store
+    tm = create_manager(storage)
+    tm.store.load()
+    tm.store.clear()
+    tm.store.add_many(make_records(n))
+    tm.store.compact()
+    tm.store.close()
+
+    tm = create_manager(storage)
+    gc.collect()
+    tracemalloc.start()
+    tm.store.load()
+    tm.load_tasks()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tsk = next(iter(tm.loaded.values()))
+    tm.store.close()
+    return retained / n, object_size(tsk)
+
+
+def main():
+    random.seed(0)
+    os.chdir(tempfile.mkdtemp())
+    print(f"{'storage':>8} {'tasks':>8} {'bytes/loaded task':>18} {'bytes/task object':>18}")
+    for storage in ["journal", "sqlite"]:
+        for n in [10 ** 4, 10 ** 5]:
+            per_task, per_object = bench_manager(n, storage)
+            print(f"{storage:>8} {n:>8} {per_task:>18.0f} {per_object:>18}")
+
+
+if __name__ == "__main__":
+    main()
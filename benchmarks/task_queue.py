@@ -0,0 +1,110 @@
+import sys
+import random
+import time
+from queue import PriorityQueue
+from datetime import datetime as dt, timedelta as td
+
+sys.path.append("../src")
+
+from core.task.task_queue import TaskHeap, TimingWheel, BucketQueue  # noqa: E402
+
+
+class Item:
+    pass
+
+
+def make_keys(n: int) -> list:
+    # reminders on minute boundaries spread over one day, like cron based tasks
+    start = dt.now().replace(second=0, microsecond=0)
+    return [(start + td(minutes=random.randint(0, 1440)), start + td(microseconds=i)) for i in range(n)]
+
+
+def bench_priority_queue(items: list, keys: list, cancel: list) -> tuple:
+    q = PriorityQueue()
+    t = time.perf_counter()
+    for item, key in zip(items, keys):
+        q.put((key[0], key[1], item))
+    t_insert = time.perf_counter() - t
+
+    # removal as done before the indexed heap
+    t = time.perf_counter()
+    for item in cancel:
+        for entry in q.queue:
+            if entry[2] is item:
+                q.queue.remove(entry)
+                break
+    t_cancel = time.perf_counter() - t
+
+    # the list removals broke the heap invariant, which is ignored here
+    t = time.perf_counter()
+    while not q.empty():
+        q.get()
+    t_pop = time.perf_counter() - t
+    return t_insert, t_cancel, t_pop
+
+
+def bench_queue(queue, items: list, keys: list, cancel: list) -> tuple:
+    t = time.perf_counter()
+    for item, key in zip(items, keys):
+        queue.push(item, key)
+    t_insert = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for item in cancel:
+        queue.remove(item)
+    t_cancel = time.perf_counter() - t
+
+    t = time.perf_counter()
+    while not queue.empty():
+        queue.pop()
+    t_pop = time.perf_counter() - t
+    return t_insert, t_cancel, t_pop
+
+
+def bench_spike(queue, items: list, pop_group: bool) -> tuple:
+    # every task shares the same cron string and is due at the same minute, like "0 8 * * *"
+    key = dt.now().replace(second=0, microsecond=0)
+    t = time.perf_counter()
+    for i, item in enumerate(items):
+        queue.push(item, (key, key + td(microseconds=i)))
+    t_insert = time.perf_counter() - t
+
+    t = time.perf_counter()
+    while not queue.empty():
+        if pop_group:
+            queue.pop_group()
+        else:
+            queue.pop()
+    t_pop = time.perf_counter() - t
+    return t_insert, t_pop
+
+
+def main():
+    random.seed(0)
+    n_cancel = 100
+    print(f"{'tasks':>8} {'backend':>14} {'insert/task':>12} {'cancel/task':>12} {'pop/task':>12}")
+    for n in [10 ** 4, 10 ** 5, 10 ** 6]:
+        keys = make_keys(n)
+        items = [Item() for _ in range(n)]
+        cancel = random.sample(items, n_cancel)
+        results = {"PriorityQueue": bench_priority_queue(items, keys, cancel),
+                   "TaskHeap": bench_queue(TaskHeap(), items, keys, cancel),
+                   "TimingWheel": bench_queue(TimingWheel(), items, keys, cancel)}
+        for name, (t_insert, t_cancel, t_pop) in results.items():
+            print(f"{n:>8} {name:>14} "
+                  f"{t_insert / n * 1e6:>10.2f}us "
+                  f"{t_cancel / n_cancel * 1e6:>10.2f}us "
+                  f"{t_pop / (n - n_cancel) * 1e6:>10.2f}us")
+
+    print()
+    print(f"{'tasks':>8} {'spike':>14} {'insert/task':>12} {'pop/task':>12}")
+    for n in [10 ** 4, 10 ** 5]:
+        items = [Item() for _ in range(n)]
+        results = {"TaskHeap": bench_spike(TaskHeap(), items, False),
+                   "BucketQueue": bench_spike(BucketQueue(TaskHeap(), lambda item: "0 8 * * *"), items, True)}
+        for name, (t_insert, t_pop) in results.items():
+            print(f"{n:>8} {name:>14} {t_insert / n * 1e6:>10.2f}us {t_pop / n * 1e6:>10.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import discord
 from core.bot.errors import OnMessageCheckException
 from typing import Union
@@ -33,6 +34,9 @@ class BotClient(commands.Bot, CogMethodHandler):
         self.permit = Permissions(self.data, self.config)
         self.parser = MessageParser()
 
+        # recipients of a fan out message per channel message or per round of direct messages
+        self.fan_out_batch = 20
+
         # flags
         self.restart = False
 
@@ -58,11 +62,45 @@ class BotClient(commands.Bot, CogMethodHandler):
                         await self.get_user(pkt.author_id).send(ctx.message)
                 except Exception as e:
                     print(e)
+            elif pkt.cmd == "fan_out":
+                try:
+                    await self.fan_out(pkt)
+                except Exception as e:
+                    print(e)
             else:
                 fct = self.cmd_parsers[pkt.cmd][0]
                 cog = self.cmd_parsers[pkt.cmd][1]
                 await fct(cog, pkt)
 
+    async def fan_out(self, pkt):
+        """
+        Delivers a message to many users in batches of fan_out_batch.
+        Public messages mention the users and the role in their channel, private ones are sent to every user
+        and to every member of the role.
+        """
+        ctx = self.parser.parse(pkt.message, pkt.message_args)
+        if ctx.privacy == "public" and pkt.channel_id is not None:
+            channel = self.get_channel(pkt.channel_id)
+            mentions = [f"<@{u}>" for u in pkt.user_ids]
+            if pkt.role_id is not None:
+                mentions.insert(0, f"<@&{pkt.role_id}>")
+            for i in range(0, len(mentions), self.fan_out_batch):
+                await channel.send(" ".join(mentions[i:i + self.fan_out_batch]) + " " + ctx.message)
+            return
+
+        user_ids = list(pkt.user_ids)
+        guild = self.get_guild(pkt.server_id) if pkt.server_id is not None else None
+        role = guild.get_role(pkt.role_id) if guild is not None and pkt.role_id is not None else None
+        if role is not None:
+            user_ids += [m.id for m in role.members]
+        users = [u for u in map(self.get_user, dict.fromkeys(user_ids)) if u is not None]
+        for i in range(0, len(users), self.fan_out_batch):
+            results = await asyncio.gather(*[u.send(ctx.message) for u in users[i:i + self.fan_out_batch]],
+                                           return_exceptions=True)
+            for r in results:
+                if isinstance(r, Exception):
+                    print(r)
+
     # Events
     async def on_ready(self):
         # sending package to task manager to let it start
@@ -90,6 +128,14 @@ class BotClient(commands.Bot, CogMethodHandler):
     async def on_guild_join(self, guild):
         self.change_prefix(self.default_prefix, guild.id)
 
+    async def on_guild_remove(self, guild):
+        # tasks saved without a server are found by their channel
+        self.purge_tasks("server_id", [guild.id])
+        self.purge_tasks("channel_id", [c.id for c in guild.channels])
+
+    async def on_guild_channel_delete(self, channel):
+        self.purge_tasks("channel_id", [channel.id])
+
     async def on_command_error(self, ctx, exception):
         try:
             if isinstance(exception, commands.errors.CheckFailure):
@@ -114,6 +160,13 @@ class BotClient(commands.Bot, CogMethodHandler):
         await self.change_presence(status=discord.Status.offline)
         await self.logout()
 
+    def purge_tasks(self, field: str, values: list):
+        """
+        Deletes the tasks of deleted channels or servers, without them they would fail at every execution.
+        """
+        t = self.ipc.pack()
+        self.ipc.send(dst="task", package=t, cmd="purge", field=field, values=values)  # sent to every shard
+
     def return_prefix(self, _, message):
         if message.guild is None:
             return self.default_prefix
@@ -1,24 +1,37 @@
+import json
 from discord.ext import commands
 from tabulate import tabulate as tab
 from core.permissions import is_owner, is_it_me
+from core.enums import Dates
 
 
 class Tasks(commands.Cog):
+
+    page_size = 10
+
     def __init__(self, bot):
         self.bot = bot
         self.bot.permit.add_group("task", True)
         self.bot.permit.add_group("taskExtra", False)
 
     @commands.command()
-    async def gt(self, ctx, a_id=None):
+    async def gt(self, ctx, a_id=None, page=1):
         """
-        Displays all active tasks.
+        Displays active tasks, ten per page.
 
         a_id:
 
             The id of the user. Leave it empty or set your id, to get your own messages.
             Set 0 to get system tasks.
+
+        page:
+
+            The page to display, starting at 1. Set your id as a_id, to see further pages of your own tasks.
         """
+        try:
+            page = max(int(page), 1)
+        except ValueError:
+            raise RuntimeError(f"'{page}' is no valid page.")
         author_id = ctx.author.id
         if a_id is not None:
             if not is_it_me(ctx, int(a_id)) and not is_owner(ctx):
@@ -28,18 +41,70 @@ class Tasks(commands.Cog):
         pipe = self.bot.ipc.send(dst="task",
                                  create_pipe=True,
                                  package=t, cmd="get_tasks",
-                                 author_id=author_id)
-        tasks = pipe.recv()
-        if isinstance(tasks, Exception):
-            raise tasks
+                                 author_id=author_id,
+                                 offset=(page - 1) * self.page_size,
+                                 limit=self.page_size)
+        answer = pipe.recv()
+        if isinstance(answer, Exception):
+            raise answer
+        tasks = answer["tasks"]
+        pages = (answer["total"] + self.page_size - 1) // self.page_size
+        if len(tasks) == 0:
+            raise RuntimeError(f"Page {page} does not exist, there are {pages} pages.")
         headers = ["ID", "Type", "Label", "Creation Date", "Next Execution Date"]
         table = []
         for i in range(len(tasks)):
-            table.append([i+1,
+            # long labels would exceed the message limit of discord
+            label = str(tasks[i]["extra"]["label"])
+            table.append([tasks[i]["extra"]["id"],
                           tasks[i]["extra"]["type"],
-                          tasks[i]["extra"]["label"],
+                          label if len(label) <= 30 else label[:27] + "...",
                           tasks[i]["extra"]["creation_time"],
                           tasks[i]["extra"]["next_time"]])
+        await ctx.send(f"```{tab(table, headers=headers)}\n\nPage {page}/{pages}, {answer['total']} tasks```")
+
+    @commands.command()
+    async def th(self, ctx, task_id=None, a_id=None):
+        """
+        Displays the last executions of your tasks, latest first.
+
+        task_id:
+
+            Shows only the executions of this task, it may be deleted already.
+
+        a_id:
+
+            The id of the user. Leave it empty or set your id, to get your own executions.
+            Set 0 to get system tasks.
+        """
+        if task_id is not None:
+            try:
+                task_id = int(task_id)
+            except ValueError:
+                raise RuntimeError(f"'{task_id}' is no valid task id.")
+        author_id = ctx.author.id
+        if a_id is not None:
+            if not is_it_me(ctx, int(a_id)) and not is_owner(ctx):
+                raise commands.CheckFailure()
+            author_id = int(a_id)
+        t = self.bot.ipc.pack()
+        pipe = self.bot.ipc.send(dst="task",
+                                 create_pipe=True,
+                                 package=t, cmd="history",
+                                 author_id=author_id,
+                                 task_id=task_id,
+                                 limit=self.page_size)
+        answer = pipe.recv()
+        if isinstance(answer, Exception):
+            raise answer
+        if len(answer) == 0:
+            raise RuntimeError("No executions found.")
+        headers = ["ID", "Date", "Executed", "Duration", "Outcome"]
+        table = [[e["task_id"],
+                  e["scheduled"].strftime(Dates.DATE_FORMAT.value),
+                  e["started"].strftime(Dates.DATE_FORMAT.value),
+                  f"{e['duration']:.3f}s",
+                  e["outcome"]] for e in answer]
         await ctx.send(f"```{tab(table, headers=headers)}```")
 
     @commands.command("dt")
@@ -50,6 +115,7 @@ class Tasks(commands.Cog):
         task_id:
 
             The id of the task that shall be deleted. Get ids with 'gt'.
+            Several ids separated by commas delete several tasks, 'all' deletes all tasks.
 
         a_id:
 
@@ -69,9 +135,24 @@ class Tasks(commands.Cog):
 
         if task_id != "all":
             try:
-                int(task_id)
+                task_ids = [int(i) for i in task_id.split(",")]
             except ValueError:
-                raise RuntimeError("task_id must be 'all' or a valid number.")
+                raise RuntimeError("task_id must be 'all' or valid numbers separated by commas.")
+
+            if len(task_ids) > 1:
+                t = self.bot.ipc.pack()
+                pipe = self.bot.ipc.send(dst="task",
+                                         create_pipe=True,
+                                         package=t,
+                                         cmd="del_tasks",
+                                         author_id=author_id,
+                                         task_ids=task_ids)
+                missing = pipe.recv()
+                if isinstance(missing, Exception):
+                    raise missing
+                if len(missing) > 0:
+                    raise RuntimeError(f"Tasks {', '.join(str(i) for i in missing)} do not exist.")
+                return
 
         t = self.bot.ipc.pack()
         pipe = self.bot.ipc.send(dst="task",
@@ -84,6 +165,130 @@ class Tasks(commands.Cog):
         if isinstance(answer, Exception):
             raise answer
 
+    @commands.command("itasks", hidden=True)
+    @commands.check(is_owner)
+    async def import_tasks(self, ctx):
+        """
+        Imports reminders from an attached json file.
+
+        The file contains a list of reminders with the keys author_id, channel_id, date_string and message.
+        The keys label, message_args and number are optional.
+        """
+        if len(ctx.message.attachments) == 0:
+            raise RuntimeError("Attach a json file with reminders.")
+        try:
+            reminders = json.loads(await ctx.message.attachments[0].read())
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise RuntimeError(f"The file is no valid json: {e}")
+
+        # reminders are sent to the shard of their author, every shard saves them at once
+        shards = {}  # queue -> [(position in file, task)]
+        errors = []
+        for i, r in enumerate(reminders):
+            try:
+                kwargs = {"author_id": int(r["author_id"]),
+                          "channel_id": int(r["channel_id"]),
+                          "date_string": r["date_string"],
+                          "message": r["message"],
+                          "message_args": r.get("message_args", ""),
+                          "label": r.get("label", r["message"]),
+                          "number": int(r.get("number", 0))}
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append((i, f"Bad reminder: {e}"))
+                continue
+            queue = self.bot.ipc.route("task", kwargs["author_id"])[0]
+            shards.setdefault(queue, []).append((i, {"task": "Reminder", "kwargs": kwargs}))
+
+        pipes = []
+        for queue, tasks in shards.items():
+            t = self.bot.ipc.pack()
+            pipes.append((self.bot.ipc.send(dst=queue,
+                                            create_pipe=True,
+                                            package=t,
+                                            cmd="tasks",
+                                            tasks=[task for _, task in tasks]),
+                          tasks))
+        for pipe, tasks in pipes:
+            # saving many tasks takes a while, the bot keeps running meanwhile
+            answer = await self.bot.loop.run_in_executor(None, pipe.recv)
+            if isinstance(answer, Exception):
+                raise answer
+            errors += [(tasks[i][0], e) for i, e in answer]
+
+        await ctx.send(f"Imported {len(reminders) - len(errors)} of {len(reminders)} reminders.")
+        if len(errors) > 0:
+            lines = [f"{i + 1}: {e}" for i, e in sorted(errors)[:10]]
+            await ctx.send("```" + "\n".join(lines) + "```")
+
+    @commands.command("ptasks", hidden=True)
+    @commands.check(is_owner)
+    async def purge_tasks(self, ctx, field, value):
+        """
+        Deletes the tasks of all users by channel, server or task type.
+
+        field:
+            'channel', 'server' or 'type'.
+
+        value:
+            An id or the name of a task type.
+        """
+        fields = {"channel": "channel_id", "server": "server_id", "type": "type"}
+        if field not in fields:
+            raise RuntimeError(f"'{field}' is no valid field")
+        pipes = []
+        for queue in self.bot.ipc.route("task", None):
+            t = self.bot.ipc.pack()
+            pipes.append(self.bot.ipc.send(dst=queue, create_pipe=True, package=t, cmd="purge",
+                                           field=fields[field], values=[value if field == "type" else int(value)]))
+        purged = 0
+        for pipe in pipes:
+            answer = await self.bot.loop.run_in_executor(None, pipe.recv)
+            if isinstance(answer, Exception):
+                raise answer
+            purged += answer
+        await ctx.send(f"{purged} tasks deleted.")
+
+    @commands.command("tstats", hidden=True)
+    @commands.check(is_owner)
+    async def task_stats(self, ctx):
+        """
+        Displays scheduler statistics of every task manager shard.
+
+        Lag is the time between the date of a task and its dispatch, a growing lag or work queue
+        means that the scheduler cannot keep up. Every lane has its own queue and executors.
+        """
+        pipes = []
+        for queue in self.bot.ipc.route("task", None):
+            t = self.bot.ipc.pack()
+            pipes.append(self.bot.ipc.send(dst=queue, create_pipe=True, package=t, cmd="stats"))
+        headers = ["Shard", "Queued", "Fires/s", "Lag p50", "Lag p99", "Lag max", "Due p99"]
+        lane_headers = ["Shard", "Lane", "Queued", "Exec p50", "Exec p99", "Work queue", "Held", "Busy", "Timed out"]
+        table = []
+        lane_table = []
+        for pipe in pipes:
+            stats = pipe.recv()
+            if isinstance(stats, Exception):
+                raise stats
+            table.append([stats["shard"],
+                          stats["queued"],
+                          f"{stats['fires_per_second']:.2f}",
+                          f"{stats['lag']['p50']:.3f}s",
+                          f"{stats['lag']['p99']:.3f}s",
+                          f"{stats['lag']['max']:.3f}s",
+                          int(stats["backlog"]["p99"])])
+            for lane, lane_stats in stats["lanes"].items():
+                executor = lane_stats["executor"]
+                lane_table.append([stats["shard"],
+                                   lane,
+                                   lane_stats["queued"],
+                                   f"{executor['durations']['p50']:.3f}s",
+                                   f"{executor['durations']['p99']:.3f}s",
+                                   executor["queue_depth"],
+                                   lane_stats["held"],
+                                   executor["busy"],
+                                   executor["timed_out"]])
+        await ctx.send(f"```{tab(table, headers=headers)}\n\n{tab(lane_table, headers=lane_headers)}```")
+
     @commands.command("tasks", hidden=True)
     async def task_help(self, _):
         """
@@ -15,8 +15,9 @@ class DataBasic:
 class Data(DataBasic):
     path = "./data"
 
-    def __init__(self):
-
+    def __init__(self, path: str = None):
+        if path is not None:
+            self.path = path
         self._buffer = {}
         self.first_startup()
 
@@ -6,3 +6,15 @@ class Dates(Enum):
     DATE_FORMAT_DETAIL = "%d.%m.%y %H:%M:%S:%f"
     DATE_FORMAT_DATE_ONLY = "%d.%m.%y"
     TIME_FORMAT = "%H:%M:%S"
+
+
+class CatchUp(Enum):
+    ONCE = "once"
+    ALL = "all"
+    SKIP = "skip"
+
+
+class Priority(Enum):
+    SYSTEM = "system"
+    PRIVILEGED = "privileged"
+    USER = "user"
@@ -1,4 +1,5 @@
 from multiprocessing import Queue
+from queue import Empty
 from core.containers import TransferPackage
 from multiprocessing import Pipe
 from typing import Union, Any
@@ -7,11 +8,37 @@ from typing import Union, Any
 class IPC:
     def __init__(self):
         self.queues = {}
+        self.shards = {}  # entity -> number of shards
 
     def create_queues(self, *entities: str):
         for e in entities:
             self.queues[e] = Queue()
 
+    def create_shards(self, entity: str, shards: int):
+        """
+        Creates a queue for every shard of an entity.
+        Packages sent to the entity are routed by their author id, packages without one go to all shards.
+        """
+        self.shards[entity] = shards
+        self.create_queues(*[self.shard_name(entity, i) for i in range(shards)])
+
+    def shard_name(self, entity: str, shard: int) -> str:
+        if self.shards.get(entity, 1) == 1:
+            return entity
+        return f"{entity}{shard}"
+
+    @staticmethod
+    def shard_of(author_id: int, shards: int) -> int:
+        return hash(author_id) % shards
+
+    def route(self, dst: str, author_id: Union[int, None]) -> list:
+        shards = self.shards.get(dst, 1)
+        if shards == 1:
+            return [dst]
+        if author_id is None:
+            return [self.shard_name(dst, i) for i in range(shards)]
+        return [self.shard_name(dst, self.shard_of(author_id, shards))]
+
     @staticmethod
     def pack(**kwargs):
         t = TransferPackage()
@@ -24,7 +51,8 @@ class IPC:
         else:
             pipe1, pipe2 = None, None
         package.label(pipe=pipe2, **kwargs)
-        self.queues[dst].put(package)
+        for queue in self.route(dst, kwargs.get("author_id")):
+            self.queues[queue].put(package)
         return pipe1
 
     def check_queue(self, entity: str) -> Union[Any, None]:
@@ -36,3 +64,11 @@ class IPC:
     def check_queue_block(self, entity: str) -> Union[Any, None]:
         queue: Queue = self.queues[entity]
         return queue.get()
+
+    def check_queue_timeout(self, entity: str, timeout: Union[float, None]) -> Union[Any, None]:
+        # blocks until a package arrives or the timeout expires, None blocks forever
+        queue: Queue = self.queues[entity]
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            return None
@@ -1,3 +1,11 @@
+from .schedule import *
 from .task_base import *
 from .task_control import *
+from .task_queue import *
+from .task_executor import *
+from .task_record import *
+from .task_store import *
+from .task_stats import *
+from .task_quota import *
+from .task_history import *
 from .task_exceptions import *
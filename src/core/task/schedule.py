@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+from weakref import WeakValueDictionary
+from threading import Lock
+from datetime import datetime as dt, timedelta as td
+from croniter import croniter as cr, CroniterBadCronError
+from core.task.task_exceptions import TaskCreationError
+
+
+class Schedule(ABC):
+    """
+    A parsed date string. Schedules are immutable and shared between all tasks with the same date string,
+    use compile_schedule to get one.
+    """
+
+    __slots__ = ("date_string", "daily_fires", "__weakref__")
+
+    cron = False
+
+    def __init__(self, date_string: str):
+        self.date_string = date_string
+        self.daily_fires = 0.0  # executions on a day the schedule runs
+
+    def __reduce__(self):
+        return compile_schedule, (self.date_string,)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.date_string!r})"
+
+    @abstractmethod
+    def next_date(self, start: dt, min_interval: int = 0) -> dt:
+        pass
+
+    def following_date(self, start: dt, min_interval: int = 0) -> dt:
+        # the next date, even if it is already past, so missed dates can be caught up
+        return self.next_date(start, min_interval)
+
+
+class CronSchedule(Schedule):
+    """
+    A cronjob like date string of the form "* * * * *".
+    """
+
+    __slots__ = ("_dates", "_lock", "_last")
+
+    cron = True
+
+    def __init__(self, date_string: str):
+        Schedule.__init__(self, date_string)
+        try:
+            self._dates = cr(date_string, dt.now())
+            self._dates.get_next(dt)
+        except (CroniterBadCronError, ValueError, KeyError):
+            raise TaskCreationError("Bad date string")
+        self._lock = Lock()
+        self._last = (None, None)  # last start and its next date
+
+        # product of the values of the time fields, "*" matches every value
+        self.daily_fires = 1.0
+        for values, every in zip(self._dates.expanded, [60, 24, 1, 1, 1, 60]):
+            if every > 1:
+                self.daily_fires *= every if values == ["*"] else len(values)
+
+    def next_date(self, start: dt, min_interval: int = 0) -> dt:
+        # the first date at least min_interval minutes after start
+        if min_interval > 0:
+            start = start + td(minutes=min_interval) - td(microseconds=1)
+        with self._lock:
+            # tasks of a bucket advance from the same start one after another
+            if self._last[0] == start:
+                return self._last[1]
+            self._dates.set_current(start)
+            self._last = (start, self._dates.get_next(dt))
+            return self._last[1]
+
+
+class IntervalSchedule(Schedule):
+    """
+    A date string of the form "xh", "xm", "xs" or every combination of them.
+    """
+
+    __slots__ = ("delta",)
+
+    def __init__(self, date_string: str):
+        Schedule.__init__(self, date_string)
+        for c in ["h", "m", "s"]:
+            if date_string.count(c) > 1:
+                raise TaskCreationError(f"Multiple statements for '{c}' are not allowed")
+        values = {"h": 0, "m": 0, "s": 0}
+        buffer = ""
+        for c in date_string:
+            if c in values:
+                try:
+                    values[c] = int(buffer)
+                except ValueError:
+                    raise TaskCreationError("Bad date string")
+                if values[c] == 0:
+                    raise TaskCreationError("0 is not allowed")
+                buffer = ""
+            else:
+                buffer += c
+        if buffer != "":
+            raise TaskCreationError("Bad date string")
+        self.delta = td(hours=values["h"], minutes=values["m"], seconds=values["s"])
+        self.daily_fires = td(days=1) / self.delta
+
+    def next_date(self, start: dt, min_interval: int = 0) -> dt:
+        next_time = start + self.delta
+        now = dt.now()
+        if next_time < now:
+            next_time = now + self.delta % (now - next_time)
+        return next_time
+
+    def following_date(self, start: dt, min_interval: int = 0) -> dt:
+        return start + self.delta
+
+
+_schedules = WeakValueDictionary()  # date string -> schedule, as long as a task uses it
+
+
+def compile_schedule(date_string: str) -> Schedule:
+    schedule = _schedules.get(date_string)
+    if schedule is None:
+        if " " in date_string:
+            schedule = CronSchedule(date_string)
+        else:
+            schedule = IntervalSchedule(date_string)
+        _schedules[date_string] = schedule
+    return schedule
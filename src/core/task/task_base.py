@@ -1,22 +1,64 @@
-from croniter import croniter as cr, CroniterBadCronError
+import importlib
 from datetime import datetime as dt, timedelta as td
 from abc import ABC, abstractmethod
-from copy import deepcopy
-from core.enums import Dates
-from core.task.task_exceptions import TaskCreationError
+from core.enums import CatchUp, Priority
+from core.task.schedule import compile_schedule
+from core.task.task_record import RECORD_VERSION, to_epoch, from_epoch
+
+
+def restore_task(module: str, name: str):
+    # task classes are hidden behind their TaskContainer, so they cannot be pickled by reference
+    task_class = getattr(importlib.import_module(module), name).task_class
+    return task_class.__new__(task_class)
 
 
 class Task(ABC):
+    """
+    Tasks use slots, subclasses should declare theirs as well, so a million of them fit in memory.
+    """
+
+    __slots__ = ("author_id", "channel_id", "server_id", "label", "task_id", "_creation_time", "_name", "_kwargs")
+
+    # policy for executions that were missed, None uses the policy of the task manager
+    catch_up: CatchUp = None
+
+    # seconds an execution may take, None uses the timeout of the task manager
+    timeout: float = None
+
+    # executes the task in a separate process, changes made by run() are not transferred back
+    cpu_bound: bool = False
+
+    # seconds after its date, over which executions of many tasks are spread, None uses the task manager setting
+    spread: float = None
+
+    # lane of the task manager, user tasks of privileged authors are moved to the privileged lane
+    priority: Priority = Priority.USER
 
     def __init__(self, *, author_id, channel_id=None, server_id=None, label=None):
         self.author_id = author_id
         self.channel_id = channel_id
         self.server_id = server_id
         self.label = label
+        self.task_id = None
         self._creation_time = dt.now()
         self._name = None
         self._kwargs = None
 
+    def __reduce__(self):
+        return restore_task, (type(self).__module__, type(self).__name__), self.__getstate__()
+
+    def __getstate__(self) -> dict:
+        state = dict(getattr(self, "__dict__", {}))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if name not in ("__dict__", "__weakref__") and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     @property
     def kwargs(self) -> dict:
         return self._kwargs
@@ -41,12 +83,15 @@ class Task(ABC):
         return self._creation_time.strftime(format_string)
 
     @abstractmethod
-    def to_json(self, format_string: str) -> dict:
+    def to_json(self) -> dict:
         pass
 
-    def from_json(self, kwargs: dict):
-        self._creation_time = dt.strptime(kwargs["extra"]["creation_time"], Dates.DATE_FORMAT_DETAIL.value)
+    def from_json(self, kwargs: dict, creation_time: dt = None):
+        if creation_time is None:
+            creation_time = from_epoch(kwargs["extra"]["creation_time"])
+        self._creation_time = creation_time
         self.name = kwargs["extra"]["type"]
+        self.task_id = kwargs["extra"].get("id")
 
     @abstractmethod
     def run(self):
@@ -55,6 +100,8 @@ class Task(ABC):
 
 class TimeBasedTask(Task, ABC):
 
+    __slots__ = ("schedule", "min_interval", "counter", "_next_time", "delete")
+
     def __init__(self, *, author_id: int,
                  channel_id: int = None,
                  server_id: int = None,
@@ -70,82 +117,44 @@ class TimeBasedTask(Task, ABC):
                       label=label
                       )
 
-        self.time = []  # empty, if date string is not of form "* * * * *"
-        self.date_string = date_string
+        self.schedule = compile_schedule(date_string)  # date string is checked while compiling
         self.min_interval = min_interval
 
-        if number == 0:
+        if number == 0 and self.schedule.cron:
             self.counter = -1
         else:
             self.counter = number
-        if " " not in date_string:
-            self.counter = number
-            for c in ["h", "m", "s"]:
-                if date_string.count(c) > 1:
-                    raise TaskCreationError(f"Multiple statements for '{c}' are not allowed")
-            buffer = ""
-            for c in date_string:
-                buffer += c
-                if c in ["h", "m", "s"]:
-                    self.time.append(buffer)
-                    buffer = ""
-            for time in self.time:
-                n = int(time[:-1])
-                if n == 0:
-                    raise TaskCreationError("0 is not allowed")
-
-        self._next_time = deepcopy(self.creation_time.replace(microsecond=0))
+
+        # the first date is calculated on first access, tasks loaded from json get theirs from there
+        self._next_time = None
 
         # flags
         self.delete = False
 
-        # next date is calculated to check if date strings are right
-        try:
-            self.get_next_date()
-        except CroniterBadCronError:
-            raise TaskCreationError("Bad date string")
+    @property
+    def date_string(self) -> str:
+        return self.schedule.date_string
 
     def get_next_date(self, start: dt = None) -> dt:
-        if len(self.time) == 0:
-
-            # "* * * * *"
-            if start is None:
-                next_time = self.next_time
-            else:
-                next_time = start
-            old_next_time = next_time
-            dates = cr(self.date_string, next_time)
-            self._next_time = dates.get_next(dt)
-            while ((self._next_time - old_next_time).seconds / 60) < self.min_interval:
-                self._next_time = dates.get_next(dt)
-
-        else:
-
-            # "1h"
-            hours = 0
-            minutes = 0
-            seconds = 0
-            for time in self.time:
-                if "h" in time:
-                    hours = int(time[:-1])
-                if "m" in time:
-                    minutes = int(time[:-1])
-                if "s" in time:
-                    seconds = int(time[:-1])
-            delta = td(hours=hours, minutes=minutes, seconds=seconds)
-            self._next_time = self.next_time + delta
-            if self.next_time < dt.now():
-                diff = delta % (dt.now() - self.next_time)
-                self._next_time = dt.now() + diff
+        # interval based tasks always continue from their last date
+        if start is None or not self.schedule.cron:
+            start = self.next_time
+        self._next_time = self.schedule.next_date(start, self.min_interval)
+        return self.next_time
 
+    def get_following_date(self) -> dt:
+        # missed dates are not skipped
+        self._next_time = self.schedule.following_date(self.next_time, self.min_interval)
         return self.next_time
 
     @property
     def next_time(self) -> dt:
+        if self._next_time is None:
+            self._next_time = self.schedule.next_date(self.creation_time.replace(microsecond=0), self.min_interval)
         return self._next_time
 
     def nex_time_string(self, format_string: str) -> str:
-        return self._next_time.strftime(format_string)
+        return self.next_time.strftime(format_string)
 
     def calc_counter(self):
         if self.counter > 0:
@@ -153,20 +162,24 @@ class TimeBasedTask(Task, ABC):
         if self.counter == 0:
             self.delete = True
 
-    def to_json(self, format_string: str) -> dict:
-        return {"basic": self.kwargs,
-                "extra": {"type": self.name,
-                          "creation_time": self.creation_time_string(format_string),
-                          "next_time": self.nex_time_string(Dates.DATE_FORMAT.value),
+    def to_json(self) -> dict:
+        return {"version": RECORD_VERSION,
+                "basic": self.kwargs,
+                "extra": {"id": self.task_id,
+                          "type": self.name,
+                          "creation_time": to_epoch(self.creation_time),
+                          "next_time": to_epoch(self.next_time),
                           "delete": self.delete,
                           "label": self.label,
                           "counter": self.counter
                           }
                 }
 
-    def from_json(self, kwargs: dict):
-        Task.from_json(self, kwargs)
-        self._next_time = dt.strptime(kwargs["extra"]["next_time"], Dates.DATE_FORMAT.value)
+    def from_json(self, kwargs: dict, creation_time: dt = None, next_time: dt = None):
+        Task.from_json(self, kwargs, creation_time)
+        if next_time is None:
+            next_time = from_epoch(kwargs["extra"]["next_time"])
+        self._next_time = next_time
         self.delete = kwargs["extra"]["delete"]
         self.counter = kwargs["extra"]["counter"]
 
@@ -1,17 +1,25 @@
 import importlib
+import json
 import os
+from collections import deque
 from typing import Union
 from core.task import task_base as tk
 from datetime import datetime as dt, timedelta as td
-from queue import PriorityQueue
+from core.task.task_queue import TaskHeap, TimingWheel, BucketQueue, LaneQueue
+from core.task.task_executor import ExecutorPool, ProcessPool
+from core.task.task_store import TaskJournal, TaskDatabase
+from core.task.task_import import task_dates
+from core.task.task_record import to_epoch, from_epoch
+from core.task.task_stats import Histogram, RateCounter
+from core.task.task_quota import TaskQuota
+from core.task.task_history import FireHistory
 from multiprocessing import Process
-from threading import Thread, Lock
 from core.containers import TaskContainer
 from core.system import IPC
 import time
-from core.enums import Dates
+from core.enums import Dates, CatchUp, Priority
 from .task_exceptions import UserHasNoTasksException, TaskIdDoesNotExistException, TaskCreationError
-from core.database import Data
+from core.database import Data, ConfigManager
 
 
 def task(name):
@@ -21,53 +29,187 @@ def task(name):
     return decorator
 
 
-class TaskExecutor(Thread):
-    def __init__(self, tsk: tk.TimeBasedTask, manager):
-        Thread.__init__(self)
-        self.task = tsk
-        self.manager = manager
+def task_schedule(tsk: tk.TimeBasedTask):
+    return tsk.schedule
 
-    def run(self):
-        try:
-            message = self.task.execute()
-        except Exception as e:
-            message = "send", f"An exception occurred while executing your task: {e}"
 
-        if message is not None:
-            pkt = self.manager.ipc.pack()
-            self.manager.ipc.send(dst="bot",
-                                  package=pkt,
-                                  author_id=self.task.author_id,
-                                  channel_id=self.task.channel_id,
-                                  cmd=message[0],
-                                  message=message[1],
-                                  message_args=message[2])
+def shard_file(shard: int, shards: int, name: str = "tasks") -> str:
+    if shards == 1:
+        return name
+    return f"{name}_{shard}"
 
-        self.manager.running_tasks_lock.acquire()
-        self.manager.running_tasks.remove(self)
-        self.manager.running_tasks_lock.release()
+
+def write_file(path: str, content: str):
+    # the file is replaced at once, so a crash leaves either the old or the new content
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 class TaskManager(Process):
 
-    def __init__(self, data, ipc: IPC):
+    def __init__(self, data, ipc: IPC, config: ConfigManager = None, shard: int = 0, shards: int = 1):
         Process.__init__(self)
-        # Queues
-        self.task_queue = PriorityQueue()
         self.ipc = ipc
-        self.running_tasks = []
-        self.running_tasks_lock = Lock()
+
+        # every shard owns the tasks of the authors routed to it, with its own queue and store
+        self.shard = shard
+        self.shards = shards
+        self.queue = ipc.shard_name("task", shard)
 
         self.paths = {"./tasks": "tasks"}
         self.data: Data = data
-
-        self.tasks = {}  # author mapping
+        self.config: ConfigManager = config
+
+        # "event" blocks until the next task is due or a package arrives, "poll" checks every 0.2 s
+        self.scheduler_mode = self.get_config("schedulerMode", "event")
+
+        # tasks are queued and executed in lanes, so that system tasks never wait behind user tasks
+        self.privileged = {int(a) for a in self.get_config("privilegedAuthors", "").split(",") if a.strip() != ""}
+        if self.config is not None and self.config.get_config("botOwner", "General"):
+            self.privileged.add(int(self.config.get_config("botOwner", "General")))
+
+        # "heap" orders tasks exactly, "wheel" groups them by second for cheap inserts and removals
+        wheel = self.get_config("queueBackend", "heap") == "wheel"
+        # tasks with the same schedule and date share one queue entry
+        self.task_queue = LaneQueue({p: BucketQueue(TimingWheel() if wheel else TaskHeap(), task_schedule)
+                                     for p in Priority}, self.task_priority)
+
+        # tasks dispatched per lane and loop, 0 is unlimited, the rest is dispatched in the next loop
+        self.budgets = {p: int(self.get_config(f"{p.value}DispatchBudget", "0")) for p in Priority}
+
+        queue_size = int(self.get_config("executorQueueSize", "1000"))
+        timeout = float(self.get_config("taskTimeout", "60"))
+        workers = {Priority.SYSTEM: int(self.get_config("systemExecutorWorkers", "1")),
+                   Priority.PRIVILEGED: int(self.get_config("privilegedExecutorWorkers", "1")),
+                   Priority.USER: int(self.get_config("executorWorkers", "4"))}
+        # the last executions of all lanes, written by the executors
+        self.history = FireHistory(f"{self.data.path}/{shard_file(shard, shards, 'fire_history')}.bin",
+                                   size=int(self.get_config("historySize", "10000")))
+        # cpu bound tasks of all lanes share the processes, None uses all cores
+        self.process_pool = ProcessPool(int(self.get_config("processWorkers", "0")) or None)
+        self.executors = {p: ExecutorPool(self.ipc, workers=workers[p], queue_size=queue_size, timeout=timeout,
+                                          history=self.history, process_pool=self.process_pool)
+                          for p in Priority}
+        # executions refused by a full executor, they are submitted again in the next loop
+        self.held = {p: deque() for p in Priority}
+        self.saturated = False  # due tasks were left in a lane, because its executor was full
+
+        self.store = self.create_store(shard_file(shard, shards))
+
+        self.tasks = {}  # author id -> {task id: loaded task}
+        self.loaded = {}  # task id -> loaded task
         self.task_dict = {}  # task classes
 
+        # only tasks within the horizon are loaded, the others stay in the database until refilled
+        self.horizon = self.load_horizon()
+        self.loaded_until: Union[dt, None] = None  # None, if all tasks are loaded
+
         self.next_date = None
 
+        # tasks later than this are handled by the catch up policy
+        self.date_window = td(seconds=5)
+        self.catch_up = CatchUp(self.get_config("catchUpPolicy", CatchUp.ONCE.value))
+        self.max_catch_up = int(self.get_config("maxCatchUpExecutions", "100"))
+
+        # live tasks and their executions a day are limited per author and server, 0 is unlimited.
+        # Every shard counts only its own tasks, a server's tasks are spread over the shards by author,
+        # so with n shards a server can have up to n times its limits
+        self.quota = TaskQuota(max_tasks=int(self.get_config("maxTasksPerAuthor", "0")),
+                               max_fires=float(self.get_config("maxDailyExecutionsPerAuthor", "0")),
+                               max_server_tasks=int(self.get_config("maxTasksPerServer", "0")),
+                               max_server_fires=float(self.get_config("maxDailyExecutionsPerServer", "0")))
+
+        # executions of tasks with the same date are spread over this many seconds after it
+        self.spread = float(self.get_config("dispatchSpread", "0"))
+
+        # instrumentation, queried with the "stats" command
+        self.lag = Histogram()  # seconds between dispatch time and dispatch
+        self.backlog = Histogram(smallest=1)  # due tasks per loop
+        self.fires = RateCounter()
+
         self.register_all_tasks()
 
+    def create_store(self, file: str) -> Union[TaskJournal, TaskDatabase]:
+        # "journal" persists tasks as snapshot and journal of changes, "sqlite" in a database
+        if self.get_config("taskStorage", "journal") == "sqlite":
+            return TaskDatabase(self.data, file)
+        return TaskJournal(self.data, file,
+                           compact_after=int(self.get_config("journalCompaction", "1000")),
+                           fsync=self.get_config("journalFsync", "false") == "true")
+
+    def reshard(self):
+        """
+        Moves the tasks saved with a different number of shards to the stores of the current shards.
+        Must be called before any shard is started.
+        The new stores are written under temporary names, while the old ones stay untouched. Then the moves of
+        their files are planned in task_shards.moves and carried out, a plan interrupted by a crash is finished
+        on the next start.
+        """
+        path = f"{self.data.path}/task_shards"
+        if os.path.exists(f"{path}.moves"):
+            self.move_stores(path)
+        previous = 1
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = int(f.read())
+        if previous == self.shards:
+            write_file(path, str(self.shards))
+            return
+
+        old_stores = [self.create_store(shard_file(i, previous)) for i in range(previous)]
+        records = [r for store in old_stores for r in store.load()]
+        for store in old_stores:
+            store.close()
+
+        # ids are only unique within a store, so they are given again
+        stores = [self.create_store(shard_file(i, self.shards)) for i in range(self.shards)]
+        new_stores = [self.create_store(f"resharding_{shard_file(i, self.shards)}") for i in range(self.shards)]
+        for store in new_stores:
+            # the files of an interrupted attempt
+            for file in store.paths:
+                if os.path.exists(file):
+                    os.remove(file)
+            store.load()
+        for r in records:
+            store = new_stores[self.ipc.shard_of(r["basic"]["author_id"], self.shards)]
+            r["extra"]["id"] = store.next_id()
+            store.add(r)
+        for store in new_stores:
+            store.compact()
+            store.close()
+
+        moves = [(tmp, file) for new_store, store in zip(new_stores, stores)
+                 for tmp, file in zip(new_store.paths, store.paths) if os.path.exists(tmp)]
+        targets = {file for _, file in moves}
+        remove = {file for store in old_stores + stores for file in store.paths
+                  if file not in targets and os.path.exists(file)}
+        write_file(f"{path}.moves", json.dumps({"shards": self.shards, "moves": moves, "remove": sorted(remove)}))
+        self.move_stores(path)
+
+    @staticmethod
+    def move_stores(path: str):
+        # every step can be repeated, if the moves were interrupted
+        with open(f"{path}.moves") as f:
+            plan = json.load(f)
+        for tmp, file in plan["moves"]:
+            if os.path.exists(tmp):
+                os.replace(tmp, file)
+        for file in plan["remove"]:
+            if os.path.exists(file):
+                os.remove(file)
+        write_file(path, str(plan["shards"]))
+        os.remove(f"{path}.moves")
+
+    def get_config(self, name: str, default: str) -> str:
+        if self.config is None:
+            return default
+        self.config.set_default_config(name, "Tasks", default)
+        return self.config.get_config(name, "Tasks")
+
     def register_task(self, module_path: str, file: str):
         task_module = importlib.import_module(f'{module_path}.{file}')
 
@@ -92,67 +234,179 @@ class TaskManager(Process):
                         self.register_task(self.paths[path], file[:-3])
 
     def import_tasks(self, tasks: list):
-        for t in tasks:
-            self.add_task_from_dict(t)
+        for chunk in self.chunks(tasks):
+            for t, dates in zip(chunk, task_dates(chunk, dt.now())):
+                self.add_task_from_dict(t, dates)
         self.set_next_date()
 
-    def export_tasks(self):
-        tasks = []
-        for v in self.tasks.values():
-            t: tk.TimeBasedTask
-            for t in v:
-                tasks.append(t.to_json(Dates.DATE_FORMAT_DETAIL.value))
-        return tasks
+    @staticmethod
+    def chunks(tasks, size: int = 10000):
+        chunk = []
+        for t in tasks:
+            chunk.append(t)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def load_horizon(self) -> Union[td, None]:
+        # the journal keeps every task in memory anyway, so it loads all of them
+        if isinstance(self.store, TaskDatabase):
+            return td(hours=float(self.get_config("loadHorizon", "24")))
+        return None
 
-    def add_task(self, pkt):
-        if pkt.author_id not in self.tasks.keys():
-            self.tasks[pkt.author_id] = []  # author id in task list
+    def load_tasks(self):
+        self.count_tasks()
+        if self.horizon is None:
+            self.loaded_until = None
+            self.import_tasks(self.store.iter_records())
+            return
+        self.loaded_until = dt.now() + self.horizon
+        self.import_tasks(self.store.iter_records(until=self.loaded_until.timestamp()))
+
+    def refill_time(self) -> Union[dt, None]:
+        if self.loaded_until is None:
+            return None
+        return self.loaded_until - self.horizon / 2
+
+    def refill_tasks(self):
+        if self.loaded_until is None or dt.now() < self.refill_time():
+            return
+        start = self.loaded_until
+        self.loaded_until = dt.now() + self.horizon
+        self.import_tasks(self.store.iter_records(after=start.timestamp(), until=self.loaded_until.timestamp()))
+
+    def in_horizon(self, tsk: tk.TimeBasedTask) -> bool:
+        return self.loaded_until is None or tsk.next_time <= self.loaded_until
+
+    def map_task(self, tsk: tk.TimeBasedTask):
+        self.tasks.setdefault(tsk.author_id, {})[tsk.task_id] = tsk
+        self.loaded[tsk.task_id] = tsk
+
+    def unload_task(self, tsk: tk.TimeBasedTask):
+        del self.tasks[tsk.author_id][tsk.task_id]
+        del self.loaded[tsk.task_id]
+
+    @staticmethod
+    def task_usage(tsk: tk.TimeBasedTask) -> tuple:
+        return tsk.author_id, tsk.server_id, tsk.schedule.daily_fires
+
+    def record_usage(self, record: dict) -> tuple:
+        return self.store.record_usage(record)
+
+    def count_tasks(self):
+        # the store counts all tasks, including those outside the horizon
+        self.quota.load(self.store.usage())
+
+    def claim_quota(self, tsk: tk.TimeBasedTask):
+        # every task is counted, only user tasks are limited
+        if self.task_priority(tsk) == Priority.USER:
+            self.quota.check(*self.task_usage(tsk))
+        self.quota.add(*self.task_usage(tsk))
+
+    def save_task(self, tsk: tk.TimeBasedTask):
+        self.store.add(tsk.to_json())
+
+    def save_next_date(self, tsk: tk.TimeBasedTask):
+        self.store.update(tsk.task_id,
+                          next_time=to_epoch(tsk.next_time),
+                          counter=tsk.counter,
+                          delete=tsk.delete)
+
+    def create_task(self, name: str, kwargs: dict) -> tk.TimeBasedTask:
         try:
-            tsk: tk.TimeBasedTask = self.task_dict[pkt.task](**pkt.kwargs)  # task creation
+            tsk: tk.TimeBasedTask = self.task_dict[name](**kwargs)  # task creation
         except Exception as e:
             raise TaskCreationError(f"Task could not be created: {e}")
-        tsk.name = pkt.task
-        tsk.kwargs = pkt.kwargs
+        tsk.name = name
+        tsk.kwargs = kwargs
+        tsk.task_id = self.store.next_id()
         tsk.calc_counter()
-        self.task_queue.put((tsk.next_time, tsk.creation_time, tsk))  # task is added to queue
-        self.tasks[pkt.author_id].append(tsk)  # task is appended to author list
-        self.set_next_date()    # next time is calculated
-        self.data.set_json(file="tasks", data=self.export_tasks())
+        return tsk
 
-    def add_task_from_dict(self, tsk_dict: dict):
-        # return, when task shall be deleted and next time is in the past
-        if dt.now() > dt.strptime(tsk_dict["extra"]["next_time"], Dates.DATE_FORMAT.value) and \
-                tsk_dict["extra"]["delete"]:
-            return
+    def add_task(self, pkt):
+        tsk = self.create_task(pkt.task, pkt.kwargs)
+        self.claim_quota(tsk)
+        self.save_task(tsk)
+        tsk.kwargs = None  # saved in the store
+        if self.in_horizon(tsk):
+            self.queue_task(tsk)  # task is added to queue
+            self.map_task(tsk)  # task is appended to author list
+            self.set_next_date()    # next time is calculated
+
+    def add_tasks(self, tasks: list) -> list:
+        """
+        Creates tasks of the form {"task": type, "kwargs": arguments}, which are saved and queued at once.
+        Returns (position, error) for every task, that could not be created.
+        """
+        created = []
+        errors = []
+        for i, t in enumerate(tasks):
+            try:
+                tsk = self.create_task(t["task"], t["kwargs"])
+                self.claim_quota(tsk)
+                created.append(tsk)
+            except (TaskCreationError, KeyError, TypeError) as e:
+                errors.append((i, str(e)))
+        self.store.add_many([tsk.to_json() for tsk in created])
+        queued = []
+        for tsk in created:
+            tsk.kwargs = None
+            if self.in_horizon(tsk):
+                self.map_task(tsk)
+                queued.append((tsk, (self.dispatch_time(tsk), tsk.creation_time)))
+        self.task_queue.push_many(queued)
+        self.set_next_date()
+        return errors
 
-        # author list is created
-        if tsk_dict["basic"]["author_id"] not in self.tasks.keys():
-            self.tasks[tsk_dict["basic"]["author_id"]] = []
+    def add_task_from_dict(self, tsk_dict: dict, dates: tuple = None):
+        # creation time and next time are calculated, if they are not given by import_tasks
+        if dates is None:
+            dates = task_dates([tsk_dict], dt.now())[0]
+        creation_time, next_time, changed = dates
+
+        # return, when task shall be deleted and next time is in the past
+        if next_time is None:
+            self.store.delete(tsk_dict["extra"]["id"])
+            self.quota.remove(*self.record_usage(tsk_dict))
+            return None
 
         # task is created
+        # the constructor arguments stay in the store, they are only needed to save new tasks
         tsk: tk.TimeBasedTask = self.task_dict[tsk_dict["extra"]["type"]](**tsk_dict["basic"])
-        tsk.kwargs = tsk_dict["basic"]
-        tsk.from_json(tsk_dict)  # task gets dictionary with extra arguments
-
-        # next time is calculated
-        if dt.now() >= tsk.next_time:
-            next_time = tsk.get_next_date(dt.now())
-        else:
-            next_time = tsk.next_time
-        self.tasks[tsk_dict["basic"]["author_id"]].append(tsk)
-        self.task_queue.put((next_time, tsk.creation_time, tsk))
+        tsk.from_json(tsk_dict, creation_time, next_time)  # task gets dictionary with extra arguments
+        if changed:
+            self.save_next_date(tsk)
+        if self.in_horizon(tsk):
+            self.map_task(tsk)
+            self.queue_task(tsk)
+        return tsk
 
     def delete_task_from_mapping(self, tsk: tk.Task):
-        author_id = tsk.author_id
-        self.tasks[author_id].remove(tsk)
-        self.data.set_json(file="tasks", data=self.export_tasks())
+        self.unload_task(tsk)
+        self.store.delete(tsk.task_id)
+        self.quota.remove(*self.task_usage(tsk))
+
+    def dispatch_time(self, tsk: tk.TimeBasedTask) -> dt:
+        spread = int(tsk.spread if tsk.spread is not None else self.spread)
+        if spread <= 0:
+            return tsk.next_time
+        # a task always gets the same offset, whole seconds keep tasks of a schedule in few buckets
+        offset = (tsk.task_id * 2654435761) % 2 ** 32 % (spread + 1)
+        return tsk.next_time + td(seconds=offset)
+
+    def queue_task(self, tsk: tk.TimeBasedTask):
+        key = (self.dispatch_time(tsk), tsk.creation_time)
+        if tsk in self.task_queue:
+            self.task_queue.update(tsk, key)
+        else:
+            self.task_queue.push(tsk, key)
 
     def delete_task_from_queue(self, tsk: tk.Task):
-        for t in self.task_queue.queue:
-            if t[2] == tsk:
-                self.task_queue.queue.remove(t)
-                return
-        raise RuntimeError("Task not in queue")
+        if tsk not in self.task_queue:
+            raise RuntimeError("Task not in queue")
+        self.task_queue.remove(tsk)
 
     def delete_task(self, tsk: tk.Task):
         self.delete_task_from_mapping(tsk)
@@ -161,62 +415,230 @@ class TaskManager(Process):
         self.set_next_date()
 
     def delete_all_tasks(self, uid: int):
-        for t in self.tasks[uid]:
+        for t in self.tasks.pop(uid, {}).values():
             self.delete_task_from_queue(t)
-        self.tasks[uid] = []
-        self.data.set_json(file="tasks", data=self.export_tasks())
+            del self.loaded[t.task_id]
+        records = self.store.author_records(uid)
+        self.store.delete_many([r["extra"]["id"] for r in records])
+        for r in records:
+            self.quota.remove(*self.record_usage(r))
+        self.set_next_date()
+
+    def delete_tasks(self, task_ids: list, author_id: int) -> list:
+        """
+        Deletes tasks of the author at once. Returns the ids, that do not exist.
+        """
+        deleted = []
+        missing = []
+        # a repeated id would be removed from the quota twice
+        for task_id in dict.fromkeys(task_ids):
+            tsk = self.tasks.get(author_id, {}).get(task_id)
+            if tsk is not None:
+                self.unload_task(tsk)
+                self.delete_task_from_queue(tsk)
+                self.quota.remove(*self.task_usage(tsk))
+                deleted.append(task_id)
+            else:
+                record = self.store.get(task_id)
+                if record is None or record["basic"]["author_id"] != author_id:
+                    missing.append(task_id)
+                else:
+                    self.quota.remove(*self.record_usage(record))
+                    deleted.append(task_id)
+        self.store.delete_many(deleted)
         self.set_next_date()
+        return missing
+
+    def purge_tasks(self, field: str, values: list) -> int:
+        """
+        Deletes every task, whose channel_id, server_id or type is one of the values.
+        Returns the amount of deleted tasks.
+        """
+        records = [r for value in values for r in self.store.indexed_records(field, value)]
+        for r in records:
+            tsk = self.loaded.get(r["extra"]["id"])
+            if tsk is not None:
+                self.unload_task(tsk)
+                self.delete_task_from_queue(tsk)
+            self.quota.remove(*self.record_usage(r))
+        self.store.delete_many([r["extra"]["id"] for r in records])
+        self.set_next_date()
+        return len(records)
 
     def get_task(self, task_id: int, author_id: int) -> tk.Task:
-        if author_id not in self.tasks.keys():
-            raise UserHasNoTasksException("No active tasks")
-        elif len(self.tasks[author_id]) == 0:
-            raise UserHasNoTasksException("No active tasks")
-        elif len(self.tasks[author_id]) <= task_id:
+        """
+        Returns the task with the given id, if it belongs to the author.
+        """
+        tsk = self.tasks.get(author_id, {}).get(task_id)
+        if tsk is not None:
+            return tsk
+
+        # tasks outside the horizon are loaded on demand
+        record = self.store.get(task_id)
+        if record is None or record["basic"]["author_id"] != author_id:
+            raise TaskIdDoesNotExistException("Task id does not exist")
+        tsk = self.add_task_from_dict(record)
+        if tsk is None:
             raise TaskIdDoesNotExistException("Task id does not exist")
-        return self.tasks[author_id][task_id]
+        if tsk.task_id not in self.loaded:
+            self.map_task(tsk)
+            self.queue_task(tsk)
+        return tsk
 
-    def get_tasks(self, author_id: int) -> list:
-        if author_id not in self.tasks.keys():
-            raise UserHasNoTasksException("No active tasks")
-        elif len(self.tasks[author_id]) == 0:
+    def get_tasks(self, author_id: int, offset: int = 0, limit: int = None) -> list:
+        if self.store.author_count(author_id) == 0:
             raise UserHasNoTasksException("No active tasks")
         tasks = []
-        for t in self.tasks[author_id]:
-            tasks.append(t.to_json(Dates.DATE_FORMAT.value))
+        for r in self.store.author_records(author_id, offset, limit):
+            # dates are formatted for display
+            extra = dict(r["extra"],
+                         creation_time=from_epoch(r["extra"]["creation_time"]).strftime(Dates.DATE_FORMAT.value),
+                         next_time=from_epoch(r["extra"]["next_time"]).strftime(Dates.DATE_FORMAT.value))
+            tasks.append({"basic": r["basic"], "extra": extra})
         return tasks
 
+    def get_task_page(self, author_id: int, offset: int, limit: int) -> dict:
+        return {"tasks": self.get_tasks(author_id, offset, limit),
+                "offset": offset,
+                "total": self.store.author_count(author_id)}
+
     def set_next_date(self):
         if not self.task_queue.empty():
-            tsk = self.task_queue.get()
-            self.next_date = tsk[0]
-            self.task_queue.put(tsk)
+            self.next_date = self.task_queue.peek_key()[0]
         else:
             self.next_date = None
 
     def check_date(self) -> bool:
         if self.next_date is not None:
-            delta = td(seconds=5)
-            now = dt.now().replace(microsecond=0)
-            if (now >= self.next_date) and (now <= self.next_date + delta):
-                return True
-            return False
+            return dt.now() >= self.next_date
         return False
 
+    def history_pending(self) -> bool:
+        return len(self.history.pending) > 0 or any(e.busy > 0 or e.queue_depth > 0 for e in self.executors.values())
+
+    def time_to_next_date(self) -> Union[float, None]:
+        dates = [d for d in [self.next_date, self.refill_time()] if d is not None]
+        # executions are written to the history within a second, when no task is due
+        if self.history_pending():
+            dates.append(dt.now() + td(seconds=1))
+        if self.saturated:
+            # waiting for the executors of a full lane, other lanes are not delayed by more than this
+            return max((min(dates) - dt.now()).total_seconds(), 0.1) if len(dates) > 0 else 0.1
+        if len(dates) == 0:
+            return None
+        return max((min(dates) - dt.now()).total_seconds(), 0)
+
+    def wait_for_package(self):
+        if self.scheduler_mode == "poll":
+            time.sleep(0.2)
+            return self.ipc.check_queue(self.queue)
+        return self.ipc.check_queue_timeout(self.queue, self.time_to_next_date())
+
+    def task_priority(self, tsk: tk.TimeBasedTask) -> Priority:
+        if tsk.priority == Priority.USER and tsk.author_id in self.privileged:
+            return Priority.PRIVILEGED
+        return tsk.priority
+
+    def pop_due_tasks(self, now: dt) -> list:
+        # lanes are popped in order of priority, each up to its budget and the free space of its executor,
+        # the rest stays queued in its lane until the next loop
+        due = []
+        for lane, queue in self.task_queue.queues.items():
+            limits = [n for n in [self.budgets[lane] or None, self.executors[lane].free] if n is not None]
+            limit = max(min(limits) - len(self.held[lane]), 0) if len(limits) > 0 else None
+            popped = 0
+            while not queue.empty() and queue.peek_key()[0] <= now and (limit is None or popped < limit):
+                group = queue.pop_group(None if limit is None else limit - popped)
+                popped += len(group)
+                due += group
+            if not queue.empty() and queue.peek_key()[0] <= now and popped == limit and \
+                    (not self.budgets[lane] or limit < self.budgets[lane]):
+                self.saturated = True
+        return due
+
+    def start_executor(self, tsk: tk.TimeBasedTask):
+        lane = self.task_priority(tsk)
+        if len(self.held[lane]) > 0 or not self.executors[lane].submit(tsk, tsk.next_time):
+            self.held[lane].append((tsk, tsk.next_time))
+
+    def submit_held(self):
+        # never blocks, executions that still do not fit stay held
+        for lane, held in self.held.items():
+            while len(held) > 0 and self.executors[lane].submit(*held[0]):
+                held.popleft()
+
+    def fire_task(self, tsk: tk.TimeBasedTask) -> bool:
+        """
+        Executes the task once. Returns False, if this was its last execution.
+        """
+        self.fires.add()
+        if tsk.delete:
+            self.delete_task_from_mapping(tsk)
+            self.start_executor(tsk)
+            return False
+        tsk.calc_counter()
+        self.start_executor(tsk)
+        return True
+
+    def dispatch_task(self, tsk: tk.TimeBasedTask, now: dt):
+        dispatch_time = self.dispatch_time(tsk)
+        self.lag.record((now - dispatch_time).total_seconds())
+        if now <= dispatch_time + self.date_window:
+            if self.fire_task(tsk):
+                tsk.get_next_date()
+                self.reschedule_task(tsk)
+            return
+
+        # the task missed its window, the catch up policy decides how often it is executed
+        policy = tsk.catch_up if tsk.catch_up is not None else self.catch_up
+        if policy == CatchUp.SKIP:
+            if tsk.delete:
+                self.delete_task_from_mapping(tsk)
+                return
+        elif policy == CatchUp.ONCE:
+            if not self.fire_task(tsk):
+                return
+        elif policy == CatchUp.ALL:
+            fired = 0
+            while tsk.next_time <= now and fired < self.max_catch_up:
+                if not self.fire_task(tsk):
+                    return
+                fired += 1
+                tsk.get_following_date()
+        if tsk.next_time <= now:
+            tsk.get_next_date(now)
+        self.reschedule_task(tsk)
+
+    def reschedule_task(self, tsk: tk.TimeBasedTask):
+        self.save_next_date(tsk)
+        if self.in_horizon(tsk):
+            self.queue_task(tsk)
+        else:
+            self.unload_task(tsk)
+
     def tasks_loop(self):
+        self.saturated = False
+        self.submit_held()
         if self.check_date():
-            tsk_tuple: tuple = self.task_queue.get()
-            tsk: tk.TimeBasedTask = tsk_tuple[2]
-            if not tsk.delete:
-                tsk.calc_counter()
-                new_task_tuple = (tsk.get_next_date(), tsk.creation_time, tsk)
-                self.task_queue.put(new_task_tuple)
-            else:
-                self.delete_task_from_mapping(tsk)
+            now = dt.now()
+            due = self.pop_due_tasks(now)
+            self.backlog.record(len(due))
+            for tsk in due:
+                self.dispatch_task(tsk, now)
             self.set_next_date()
-            executor = TaskExecutor(tsk, self)
-            self.running_tasks.append(executor)
-            executor.start()
+        self.saturated = self.saturated or any(len(held) > 0 for held in self.held.values())
+
+    def get_stats(self) -> dict:
+        return {"shard": self.shard,
+                "queued": len(self.task_queue),
+                "lanes": {lane.value: {"queued": len(self.task_queue.queues[lane]),
+                                       "held": len(self.held[lane]),
+                                       "executor": self.executors[lane].get_stats()}
+                          for lane in Priority},
+                "loaded": len(self.loaded),
+                "lag": self.lag.summary(),
+                "backlog": self.backlog.summary(),
+                "fires_per_second": self.fires.rate()}
 
     def parse_commands(self, pkt) -> Union[str, None]:
         if pkt is not None:
@@ -227,14 +649,29 @@ class TaskManager(Process):
                     return "wait"
                 elif pkt.cmd == "task":
                     self.add_task(pkt)
+                elif pkt.cmd == "tasks":
+                    errors = self.add_tasks(pkt.tasks)
+                    if pkt.pipe is not None:
+                        pkt.pipe.send(errors)
+                elif pkt.cmd == "del_tasks":
+                    missing = self.delete_tasks(pkt.task_ids, pkt.author_id)
+                    pkt.pipe.send(missing)
+                elif pkt.cmd == "purge":
+                    purged = self.purge_tasks(pkt.field, pkt.values)
+                    if pkt.pipe is not None:
+                        pkt.pipe.send(purged)
+                elif pkt.cmd == "history":
+                    pkt.pipe.send(self.history.query(pkt.author_id, pkt.task_id, pkt.limit))
+                elif pkt.cmd == "stats":
+                    pkt.pipe.send(self.get_stats())
                 elif pkt.cmd == "get_tasks":
-                    tasks = self.get_tasks(pkt.author_id)
-                    pkt.pipe.send(tasks)
+                    page = self.get_task_page(pkt.author_id, pkt.offset, pkt.limit)
+                    pkt.pipe.send(page)
                 elif pkt.cmd == "del_task":
                     if pkt.task_id == "all":
                         self.delete_all_tasks(pkt.author_id)
                     else:
-                        tsk = self.get_task(int(pkt.task_id) - 1, pkt.author_id)
+                        tsk = self.get_task(int(pkt.task_id), pkt.author_id)
                         self.delete_task(tsk)
                     pkt.pipe.send(None)
             except Exception as e:
@@ -249,36 +686,44 @@ class TaskManager(Process):
         return None
 
     def stop(self):
-        t: Thread
-        for t in self.running_tasks:
-            t.join()
-        self.data.set_json(file="tasks", data=self.export_tasks())  # tasks are saved
+        timeout = float(self.get_config("stopTimeout", "10"))
+        for executor in self.executors.values():
+            executor.stop(timeout)
+        self.process_pool.shutdown()
+        self.history.close()
+        self.store.compact()  # tasks are saved
+        self.store.close()
 
     def run(self):
         try:
-            pkt = self.ipc.check_queue_block("task")
+            pkt = self.ipc.check_queue_block(self.queue)
             if pkt.cmd == "stop":
                 self.stop()
                 return
-            self.import_tasks(self.data.get_json(file="tasks"))
+            self.store.load()
+            self.history.load()
+            self.load_tasks()
         except KeyboardInterrupt:
             self.stop()
 
         try:
             while True:
-                pkt = self.ipc.check_queue("task")
+                pkt = self.wait_for_package()
                 stop = self.parse_commands(pkt)
                 if stop == "stop":
                     self.stop()
                     break
                 elif stop == "wait":
-                    self.data.set_json(file="tasks", data=self.export_tasks())
-                    while not self.task_queue.empty():
-                        self.task_queue.get()
+                    self.store.compact()
+                    self.task_queue.clear()
                     self.tasks = {}
-                    self.ipc.check_queue_block("task")
-                    self.import_tasks(self.data.get_json(file="tasks"))
+                    self.loaded = {}
+                    self.ipc.check_queue_block(self.queue)
+                    self.store.load()
+                    self.load_tasks()
+                self.refill_tasks()
                 self.tasks_loop()
-                time.sleep(0.2)
+                if not self.check_date():
+                    self.history.flush()
         except KeyboardInterrupt:
             self.stop()
@@ -16,3 +16,8 @@ class TaskIdDoesNotExistException(TaskException):
 class TaskCreationError(TaskException):
     def __init__(self, arg=""):
         TaskException.__init__(self, arg)
+
+
+class QuotaExceededError(TaskCreationError):
+    def __init__(self, arg=""):
+        TaskCreationError.__init__(self, arg)
@@ -0,0 +1,230 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Full
+from threading import Thread, Lock, Event
+from typing import Union
+from core.task import task_base as tk
+from core.system import IPC
+from core.task.task_stats import Histogram
+from core.task.task_history import FireHistory
+from datetime import datetime as dt
+
+
+def execute_task(tsk: tk.TimeBasedTask):
+    return tsk.execute()
+
+
+class ProcessPool:
+    """
+    A process pool, that is created on the first use. It can be shared by several executor pools, so the
+    processes are bounded for all of them.
+    """
+
+    def __init__(self, processes: int = None):
+        self.processes = processes  # None uses all cores
+        self.executor: Union[ProcessPoolExecutor, None] = None
+        self.lock = Lock()
+
+    def execute(self, tsk: tk.TimeBasedTask):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self.executor.submit(execute_task, tsk).result()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+class TaskExecutor(Thread):
+    """
+    A worker of the executor pool. It executes tasks from the work queue, until it is stopped
+    or cancelled by the pool because its current task exceeded the timeout.
+    """
+
+    def __init__(self, pool):
+        Thread.__init__(self, daemon=True)
+        self.pool: ExecutorPool = pool
+        self.task: Union[tk.TimeBasedTask, None] = None
+        self.scheduled: Union[dt, None] = None
+        self.started = 0.0
+        self.started_at = 0.0  # wall clock time of the start
+        self.cancelled = False
+
+    def execute(self, tsk: tk.TimeBasedTask) -> int:
+        outcome = FireHistory.OK
+        try:
+            if tsk.cpu_bound:
+                message = self.pool.execute_in_process(tsk)
+            else:
+                message = tsk.execute()
+        except Exception as e:
+            message = "send", f"An exception occurred while executing your task: {e}", ""
+            outcome = FireHistory.ERROR
+
+        if message is not None and not self.cancelled:
+            self.pool.send(tsk, message)
+        return outcome
+
+    def run(self):
+        while not self.cancelled:
+            work = self.pool.work_queue.get()
+            if work is None:
+                break
+            self.pool.set_busy(self, *work)
+            outcome = self.execute(work[0])
+            self.pool.set_idle(self, outcome)
+
+
+class ExecutorPool:
+    """
+    A fixed amount of workers, that execute tasks from a bounded work queue.
+    Submitting never blocks, a task is refused, if the queue is full. Workers that exceed the timeout are abandoned and
+    replaced, because threads cannot be killed. Their results are discarded.
+    Cpu bound tasks are handed to a process pool by the workers. A given process pool is shared and not shut down
+    by this pool, otherwise it owns one with the given amount of processes.
+    """
+
+    def __init__(self, ipc: IPC, workers: int = 4, queue_size: int = 1000, timeout: float = 60,
+                 processes: int = None, history: FireHistory = None, process_pool: ProcessPool = None):
+        self.ipc = ipc
+        self.history = history  # executions of tasks submitted with their date are recorded
+        self.size = workers
+        self.shared_process_pool = process_pool is not None
+        self.process_pool = process_pool if process_pool is not None else ProcessPool(processes)
+        self.timeout = timeout
+        self.work_queue = Queue(maxsize=queue_size)
+        self.workers = []
+        self.lock = Lock()
+        self.watchdog: Union[Thread, None] = None
+        self.stopped = Event()
+
+        # counters
+        self.busy = 0
+        self.executed = 0
+        self.timed_out = 0
+        self.durations = Histogram()  # seconds per execution, recorded under the lock
+
+    @property
+    def queue_depth(self) -> int:
+        return self.work_queue.qsize()
+
+    @property
+    def free(self) -> Union[int, None]:
+        # tasks, that can be submitted without being refused, None is unlimited
+        if self.work_queue.maxsize <= 0:
+            return None
+        return max(self.work_queue.maxsize - self.work_queue.qsize(), 0)
+
+    def start(self):
+        if self.watchdog is not None:
+            return
+        self.stopped.clear()
+        for _ in range(self.size):
+            self.add_worker()
+        self.watchdog = Thread(target=self.check_timeouts, daemon=True)
+        self.watchdog.start()
+
+    def add_worker(self):
+        worker = TaskExecutor(self)
+        self.workers.append(worker)
+        worker.start()
+
+    def submit(self, tsk: tk.TimeBasedTask, scheduled: dt = None) -> bool:
+        """
+        Queues the task for a worker. Returns False, if the work queue is full.
+        """
+        self.start()
+        try:
+            self.work_queue.put_nowait((tsk, scheduled))
+        except Full:
+            return False
+        return True
+
+    def execute_in_process(self, tsk: tk.TimeBasedTask):
+        return self.process_pool.execute(tsk)
+
+    def send(self, tsk: tk.TimeBasedTask, message: tuple):
+        # an optional fourth element holds further arguments of the bot command
+        extra = message[3] if len(message) > 3 else {}
+        pkt = self.ipc.pack()
+        self.ipc.send(dst="bot",
+                      package=pkt,
+                      author_id=tsk.author_id,
+                      channel_id=tsk.channel_id,
+                      cmd=message[0],
+                      message=message[1],
+                      message_args=message[2],
+                      **extra)
+
+    def set_busy(self, worker: TaskExecutor, tsk: tk.TimeBasedTask, scheduled: dt = None):
+        with self.lock:
+            worker.task = tsk
+            worker.scheduled = scheduled
+            worker.started = time.monotonic()
+            worker.started_at = time.time()
+            self.busy += 1
+
+    def set_idle(self, worker: TaskExecutor, outcome: int = FireHistory.OK):
+        with self.lock:
+            if worker.cancelled:
+                return
+            tsk = worker.task
+            duration = time.monotonic() - worker.started
+            worker.task = None
+            self.busy -= 1
+            self.executed += 1
+            self.durations.record(duration)
+        self.record(worker, tsk, duration, outcome)
+
+    def record(self, worker: TaskExecutor, tsk: tk.TimeBasedTask, duration: float, outcome: int):
+        if self.history is not None and worker.scheduled is not None:
+            self.history.record(tsk.task_id, tsk.author_id, worker.scheduled, worker.started_at, duration, outcome)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"workers": self.size,
+                    "busy": self.busy,
+                    "queue_depth": self.queue_depth,
+                    "executed": self.executed,
+                    "timed_out": self.timed_out,
+                    "durations": self.durations.summary()}
+
+    def task_timeout(self, tsk: tk.TimeBasedTask) -> float:
+        if tsk.timeout is not None:
+            return tsk.timeout
+        return self.timeout
+
+    def check_timeouts(self):
+        while not self.stopped.wait(1):
+            with self.lock:
+                now = time.monotonic()
+                for worker in list(self.workers):
+                    tsk = worker.task
+                    if tsk is not None and now - worker.started > self.task_timeout(tsk):
+                        worker.cancelled = True
+                        self.workers.remove(worker)
+                        self.busy -= 1
+                        self.timed_out += 1
+                        self.send(tsk, ("send", "Your task was cancelled, because it took too long.", ""))
+                        self.record(worker, tsk, now - worker.started, FireHistory.TIMEOUT)
+                        self.add_worker()
+
+    def stop(self, timeout: float = 10):
+        if self.watchdog is None:
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self.workers:
+            try:
+                self.work_queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+            except Full:
+                break
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        self.stopped.set()
+        self.watchdog = None
+        self.workers = []
+        if not self.shared_process_pool:
+            self.process_pool.shutdown()
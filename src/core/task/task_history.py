@@ -0,0 +1,121 @@
+import os
+import struct
+from array import array
+from collections import deque
+from datetime import datetime as dt
+from threading import Lock
+from typing import Union
+from core.task.task_record import to_epoch, from_epoch
+
+
+class FireHistory:
+    """
+    The last executions of all tasks in a ring buffer of fixed size, kept in arrays of machine integers.
+    Recording an execution only appends it to a pending queue, flush converts the pending executions and writes
+    them to their slots of a file of fixed size. Dates are microseconds since the epoch. Thread safe.
+    """
+
+    OK = 0
+    ERROR = 1
+    TIMEOUT = 2
+    outcome_names = ("ok", "error", "timed out")
+
+    # sequence number, task id, author id, scheduled, started, duration, outcome
+    layout = struct.Struct("<qqqqqqb")
+
+    def __init__(self, path: Union[str, None] = None, size: int = 10000):
+        self.path = path  # None keeps the history in memory only
+        self.size = size
+        self.sequence = array("q", bytes(8 * size))  # 0 is an empty slot
+        self.task_ids = array("q", bytes(8 * size))
+        self.author_ids = array("q", bytes(8 * size))
+        self.scheduled = array("q", bytes(8 * size))
+        self.started = array("q", bytes(8 * size))
+        self.durations = array("q", bytes(8 * size))
+        self.outcomes = array("b", bytes(size))
+        self.last = 0  # sequence number of the latest execution
+        self.pending = deque(maxlen=size)  # executions, that are not flushed yet
+        self.file = None
+        self.position = 0  # slot at the position of the file
+        self.lock = Lock()
+
+    def set_slot(self, values: tuple):
+        i = values[0] % self.size
+        (self.sequence[i], self.task_ids[i], self.author_ids[i], self.scheduled[i], self.started[i],
+         self.durations[i], self.outcomes[i]) = values
+
+    def load(self):
+        if self.path is None:
+            return
+        records = []
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                content = f.read()
+            records = [r for r in self.layout.iter_unpack(content[:len(content) - len(content) % self.layout.size])
+                       if r[0] > 0]
+        # the file is written again, if the size of the history was changed
+        records = sorted(records)[-self.size:]
+        with self.lock:
+            for r in records:
+                self.set_slot(r)
+            self.last = records[-1][0] if len(records) > 0 else 0
+            expected = self.size * self.layout.size
+            if not os.path.exists(self.path) or os.path.getsize(self.path) != expected:
+                with open(self.path, "wb") as f:
+                    f.write(bytes(expected))
+                    for r in records:
+                        f.seek(r[0] % self.size * self.layout.size)
+                        f.write(self.layout.pack(*r))
+            self.file = open(self.path, "r+b")
+            self.position = 0
+
+    def record(self, task_id: int, author_id: int, scheduled: dt, started: float, duration: float, outcome: int):
+        # started is a timestamp and duration in seconds, appending to a deque needs no lock
+        self.pending.append((task_id, author_id, scheduled, started, duration, outcome))
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        with self.lock:
+            while len(self.pending) > 0:
+                task_id, author_id, scheduled, started, duration, outcome = self.pending.popleft()
+                self.last += 1
+                values = (self.last, task_id, author_id, to_epoch(scheduled), int(started * 1000000),
+                          int(duration * 1000000), outcome)
+                self.set_slot(values)
+                if self.file is not None:
+                    # slots are written in order, so the file is only positioned after a wrap around
+                    i = self.last % self.size
+                    if i != self.position:
+                        self.file.seek(i * self.layout.size)
+                    self.file.write(self.layout.pack(*values))
+                    self.position = i + 1
+            if self.file is not None:
+                self.file.flush()
+
+    def query(self, author_id: int, task_id: int = None, limit: int = 10) -> list:
+        """
+        Returns the latest executions of the tasks of the author, or of one of them, latest first.
+        """
+        self.flush()
+        executions = []
+        with self.lock:
+            for seq in range(self.last, max(self.last - self.size, 0), -1):
+                i = seq % self.size
+                if len(executions) == limit:
+                    break
+                if self.author_ids[i] != author_id or (task_id is not None and self.task_ids[i] != task_id):
+                    continue
+                executions.append({"task_id": self.task_ids[i],
+                                   "scheduled": from_epoch(self.scheduled[i]),
+                                   "started": from_epoch(self.started[i]),
+                                   "duration": self.durations[i] / 1000000,
+                                   "outcome": self.outcome_names[self.outcomes[i]]})
+        return executions
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
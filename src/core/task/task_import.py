@@ -0,0 +1,42 @@
+import numpy as np
+from datetime import datetime as dt, timedelta as td
+from core.task.schedule import compile_schedule
+from core.task.task_record import to_epoch, from_epoch
+
+
+def task_dates(records: list, now: dt) -> list:
+    """
+    Calculates creation time and next execution date of task dictionaries in bulk.
+    Returns a tuple (creation time, next time, next time changed) for every task.
+    Next time is None, if the task is finished and shall be deleted.
+    """
+    if len(records) == 0:
+        return []
+    # dates are microseconds since the epoch
+    next_times = np.array([r["extra"]["next_time"] for r in records], dtype=np.int64)
+    now_us = to_epoch(now)
+
+    finished = (next_times < now_us) & np.array([r["extra"]["delete"] for r in records], dtype=bool)
+    due = (next_times <= now_us) & ~finished
+    schedules = [compile_schedule(r["basic"].get("date_string", "* * * * *")) for r in records]
+
+    # interval based tasks continue from their last date
+    interval = np.array([not s.cron for s in schedules], dtype=bool) & due
+    if interval.any():
+        deltas = np.array([0 if s.cron else s.delta // td(microseconds=1) for s in schedules],
+                          dtype=np.int64)[interval]
+        next_interval = next_times[interval] + deltas
+        late = next_interval < now_us
+        next_interval[late] = now_us + deltas[late] % (now_us - next_interval[late])
+        next_times[interval] = next_interval
+
+    # cron based tasks are all due now, so every date string is advanced once
+    groups = {}
+    for i in np.flatnonzero(due & ~interval):
+        key = (schedules[i], records[i]["basic"].get("min_interval", 0))
+        groups.setdefault(key, []).append(i)
+    for (schedule, min_interval), indexes in groups.items():
+        next_times[indexes] = to_epoch(schedule.next_date(now, min_interval))
+
+    return [(from_epoch(r["extra"]["creation_time"]), None if f else from_epoch(n), d)
+            for r, n, f, d in zip(records, next_times.tolist(), finished.tolist(), due.tolist())]
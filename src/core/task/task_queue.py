@@ -0,0 +1,383 @@
+import heapq
+from itertools import islice
+from typing import Any, Hashable, Callable, Union
+
+
+class TaskHeap:
+    """
+    A binary min heap, that keeps the position of every item in an index.
+    This allows removing and rescheduling items in O(log n) without searching the heap.
+    Items must be hashable and can only be contained once.
+    """
+
+    def __init__(self):
+        self._heap = []  # entries of the form [key, sequence number, item]
+        self._index = {}  # item -> position in heap
+        self._sequence = 0  # keeps insertion order for equal keys
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._index
+
+    def empty(self) -> bool:
+        return len(self._heap) == 0
+
+    def items(self) -> list:
+        return [entry[2] for entry in self._heap]
+
+    def clear(self):
+        self._heap = []
+        self._index = {}
+
+    def push(self, item: Hashable, key):
+        if item in self._index:
+            raise KeyError("Item is already in heap")
+        entry = [key, self._sequence, item]
+        self._sequence += 1
+        self._heap.append(entry)
+        self._index[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def push_many(self, entries: list):
+        """
+        Pushes (item, key) pairs. Large batches are appended and the heap is rebuilt in O(n).
+        """
+        if len(entries) < len(self._heap):
+            for item, key in entries:
+                self.push(item, key)
+            return
+        if any(item in self._index for item, _ in entries):
+            raise KeyError("Item is already in heap")
+        for item, key in entries:
+            self._index[item] = len(self._heap)
+            self._heap.append([key, self._sequence, item])
+            self._sequence += 1
+        for pos in reversed(range(len(self._heap) // 2)):
+            self._sift_down(pos)
+
+    def peek(self) -> Any:
+        if len(self._heap) == 0:
+            raise IndexError("Peek from empty heap")
+        return self._heap[0][2]
+
+    def peek_key(self) -> Any:
+        if len(self._heap) == 0:
+            raise IndexError("Peek from empty heap")
+        return self._heap[0][0]
+
+    def pop(self) -> Any:
+        if len(self._heap) == 0:
+            raise IndexError("Pop from empty heap")
+        return self._remove_at(0)
+
+    def remove(self, item: Hashable):
+        self._remove_at(self._index[item])
+
+    def update(self, item: Hashable, key):
+        pos = self._index[item]
+        entry = self._heap[pos]
+        old_key = entry[0]
+        entry[0] = key
+        if key < old_key:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def _remove_at(self, pos: int) -> Any:
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            entry = self._heap[pos]
+            self._heap[pos] = last
+            self._index[last[2]] = pos
+            self._sift_down(pos)
+            self._sift_up(self._index[last[2]])
+        else:
+            entry = last
+        del self._index[entry[2]]
+        return entry[2]
+
+    # entries are compared as lists, the unique sequence number keeps items out of the comparison
+    def _sift_up(self, pos: int):
+        heap = self._heap
+        index = self._index
+        entry = heap[pos]
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            parent_entry = heap[parent]
+            if entry < parent_entry:
+                heap[pos] = parent_entry
+                index[parent_entry[2]] = pos
+                pos = parent
+            else:
+                break
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+    def _sift_down(self, pos: int):
+        heap = self._heap
+        index = self._index
+        size = len(heap)
+        entry = heap[pos]
+        child = 2 * pos + 1
+        while child < size:
+            right = child + 1
+            if right < size and heap[right] < heap[child]:
+                child = right
+            child_entry = heap[child]
+            if child_entry < entry:
+                heap[pos] = child_entry
+                index[child_entry[2]] = pos
+                pos = child
+                child = 2 * pos + 1
+            else:
+                break
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+
+class TimingWheel:
+    """
+    A hashed timing wheel with one slot per second. Inserting and cancelling an item is O(1)
+    as long as its slot is already in use, which is the normal case for many tasks sharing a date.
+    The used slots are ordered by a heap of seconds, so that the next due date can be looked up
+    without ticking through empty slots. Items of the same second are returned in insertion order.
+    Keys must start with a datetime.
+    """
+
+    def __init__(self):
+        self._slots = {}  # second -> {item: key}
+        self._index = {}  # item -> second
+        self._seconds = []  # heap of used seconds, may contain seconds of emptied slots
+        self._queued = set()  # seconds in heap
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._index
+
+    def empty(self) -> bool:
+        return len(self._index) == 0
+
+    def items(self) -> list:
+        return list(self._index.keys())
+
+    def clear(self):
+        self._slots = {}
+        self._index = {}
+        self._seconds = []
+        self._queued = set()
+
+    def push(self, item: Hashable, key):
+        if item in self._index:
+            raise KeyError("Item is already in timing wheel")
+        second = int(key[0].timestamp())
+        slot = self._slots.get(second)
+        if slot is None:
+            slot = self._slots[second] = {}
+            if second not in self._queued:
+                self._queued.add(second)
+                heapq.heappush(self._seconds, second)
+        slot[item] = key
+        self._index[item] = second
+
+    def push_many(self, entries: list):
+        for item, key in entries:
+            self.push(item, key)
+
+    def _first_slot(self) -> dict:
+        while len(self._seconds) > 0:
+            second = self._seconds[0]
+            slot = self._slots.get(second)
+            if slot is not None:
+                return slot
+            heapq.heappop(self._seconds)
+            self._queued.discard(second)
+        raise IndexError("Timing wheel is empty")
+
+    def peek(self) -> Any:
+        return next(iter(self._first_slot()))
+
+    def peek_key(self) -> Any:
+        slot = self._first_slot()
+        return slot[next(iter(slot))]
+
+    def pop(self) -> Any:
+        item = self.peek()
+        self.remove(item)
+        return item
+
+    def remove(self, item: Hashable):
+        second = self._index.pop(item)
+        slot = self._slots[second]
+        del slot[item]
+        if len(slot) == 0:
+            del self._slots[second]
+
+    def update(self, item: Hashable, key):
+        self.remove(item)
+        self.push(item, key)
+
+
+class Bucket:
+    """
+    Items of a BucketQueue, that share a group and the first part of their key.
+    """
+
+    __slots__ = ("id", "items")
+
+    def __init__(self, bucket_id: tuple):
+        self.id = bucket_id
+        self.items = {}  # item -> key, keeps insertion order
+
+
+class BucketQueue:
+    """
+    Wraps a TaskHeap or TimingWheel, so that items of the same group and with the same date share one entry.
+    Adding an item to an existing bucket costs no queue operation and a bucket is popped at once by pop_group.
+    Keys must start with a datetime. A bucket is ordered by the key of the item that created it.
+    """
+
+    def __init__(self, queue: Union[TaskHeap, TimingWheel], group: Callable[[Any], Hashable]):
+        self._queue = queue
+        self._group = group
+        self._buckets = {}  # (group, date) -> bucket
+        self._index = {}  # item -> bucket
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._index
+
+    def empty(self) -> bool:
+        return len(self._index) == 0
+
+    def items(self) -> list:
+        return list(self._index.keys())
+
+    def buckets(self) -> int:
+        return len(self._buckets)
+
+    def clear(self):
+        self._queue.clear()
+        self._buckets = {}
+        self._index = {}
+
+    def _add(self, item: Hashable, key) -> Union[Bucket, None]:
+        # returns the bucket, if it is new and has to be queued
+        if item in self._index:
+            raise KeyError("Item is already in queue")
+        bucket_id = (self._group(item), key[0])
+        bucket = self._buckets.get(bucket_id)
+        new = bucket is None
+        if new:
+            bucket = self._buckets[bucket_id] = Bucket(bucket_id)
+        bucket.items[item] = key
+        self._index[item] = bucket
+        return bucket if new else None
+
+    def push(self, item: Hashable, key):
+        bucket = self._add(item, key)
+        if bucket is not None:
+            self._queue.push(bucket, key)
+
+    def push_many(self, entries: list):
+        buckets = []
+        for item, key in entries:
+            bucket = self._add(item, key)
+            if bucket is not None:
+                buckets.append((bucket, key))
+        self._queue.push_many(buckets)
+
+    def peek(self) -> Any:
+        return next(iter(self._queue.peek().items))
+
+    def peek_key(self) -> Any:
+        bucket = self._queue.peek()
+        return bucket.items[next(iter(bucket.items))]
+
+    def pop(self) -> Any:
+        item = self.peek()
+        self.remove(item)
+        return item
+
+    def pop_group(self, limit: int = None) -> list:
+        # pops at most limit items, the rest of the bucket stays queued
+        if limit is not None and limit < len(self._queue.peek().items):
+            bucket = self._queue.peek()
+            items = list(islice(bucket.items, limit))
+            for item in items:
+                del bucket.items[item]
+                del self._index[item]
+            return items
+        bucket = self._queue.pop()
+        del self._buckets[bucket.id]
+        for item in bucket.items:
+            del self._index[item]
+        return list(bucket.items)
+
+    def remove(self, item: Hashable):
+        bucket = self._index.pop(item)
+        del bucket.items[item]
+        if len(bucket.items) == 0:
+            del self._buckets[bucket.id]
+            self._queue.remove(bucket)
+
+    def update(self, item: Hashable, key):
+        self.remove(item)
+        self.push(item, key)
+
+
+class LaneQueue:
+    """
+    Keeps one queue per lane, so that every lane can be popped on its own.
+    An item always belongs to the lane returned by the lane function, lanes are given in order of priority.
+    """
+
+    def __init__(self, queues: dict, lane: Callable[[Any], Hashable]):
+        self.queues = queues  # lane -> queue
+        self._lane = lane
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.queues[self._lane(item)]
+
+    def empty(self) -> bool:
+        return all(q.empty() for q in self.queues.values())
+
+    def items(self) -> list:
+        return [item for q in self.queues.values() for item in q.items()]
+
+    def buckets(self) -> int:
+        return sum(q.buckets() for q in self.queues.values())
+
+    def clear(self):
+        for q in self.queues.values():
+            q.clear()
+
+    def push(self, item: Hashable, key):
+        self.queues[self._lane(item)].push(item, key)
+
+    def push_many(self, entries: list):
+        lanes = {}
+        for item, key in entries:
+            lanes.setdefault(self._lane(item), []).append((item, key))
+        for lane, lane_entries in lanes.items():
+            self.queues[lane].push_many(lane_entries)
+
+    def peek_key(self) -> Any:
+        keys = [q.peek_key() for q in self.queues.values() if not q.empty()]
+        if len(keys) == 0:
+            raise IndexError("Peek from empty queue")
+        return min(keys)
+
+    def remove(self, item: Hashable):
+        self.queues[self._lane(item)].remove(item)
+
+    def update(self, item: Hashable, key):
+        self.queues[self._lane(item)].update(item, key)
@@ -0,0 +1,57 @@
+from core.task.task_exceptions import QuotaExceededError
+
+
+class TaskQuota:
+    """
+    Counts the live tasks of every author and server and how often they are executed a day.
+    Adding, removing and checking a task costs O(1). A limit of 0 is unlimited.
+    Every shard has its own quota, so server limits apply to the tasks of a server within one shard.
+    """
+
+    def __init__(self, max_tasks: int = 0, max_fires: float = 0, max_server_tasks: int = 0,
+                 max_server_fires: float = 0):
+        self.limits = {"author": (max_tasks, max_fires),
+                       "server": (max_server_tasks, max_server_fires)}
+        self.usage = {}  # (kind, id) -> [tasks, executions a day]
+
+    @staticmethod
+    def keys(author_id: int, server_id: int = None) -> list:
+        if server_id is None:
+            return [("author", author_id)]
+        return [("author", author_id), ("server", server_id)]
+
+    def add(self, author_id: int, server_id: int, fires: float):
+        for key in self.keys(author_id, server_id):
+            usage = self.usage.setdefault(key, [0, 0.0])
+            usage[0] += 1
+            usage[1] += fires
+
+    def remove(self, author_id: int, server_id: int, fires: float):
+        for key in self.keys(author_id, server_id):
+            usage = self.usage.get(key)
+            if usage is None:
+                continue
+            usage[0] -= 1
+            usage[1] -= fires
+            if usage[0] <= 0:
+                del self.usage[key]
+
+    def check(self, author_id: int, server_id: int, fires: float):
+        """
+        Raises QuotaExceededError, if one more task with these executions a day exceeds a limit.
+        """
+        for kind, key_id in self.keys(author_id, server_id):
+            max_tasks, max_fires = self.limits[kind]
+            tasks, daily = self.usage.get((kind, key_id), (0, 0.0))
+            owner = "You" if kind == "author" else "This server"
+            if max_tasks and tasks + 1 > max_tasks:
+                raise QuotaExceededError(f"{owner} cannot have more than {max_tasks} tasks.")
+            if max_fires and daily + fires > max_fires:
+                raise QuotaExceededError(f"{owner} cannot have tasks, that are executed more than "
+                                         f"{max_fires:g} times a day.")
+
+    def load(self, usage: dict):
+        self.usage = {key: list(value) for key, value in usage.items()}
+
+    def clear(self):
+        self.usage = {}
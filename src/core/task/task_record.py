@@ -0,0 +1,37 @@
+from datetime import datetime as dt
+from core.enums import Dates
+
+# version 1 saved dates as strings, version 2 as microseconds since the epoch
+RECORD_VERSION = 2
+
+
+def to_epoch(t: dt) -> int:
+    # exact for local datetimes, a float timestamp would round the microseconds
+    return int(t.replace(microsecond=0).timestamp()) * 1000000 + t.microsecond
+
+
+def from_epoch(timestamp: int) -> dt:
+    # the division is exact to the microsecond until 2106
+    return dt.fromtimestamp(timestamp / 1000000)
+
+
+def migrate_extra(extra: dict) -> dict:
+    if isinstance(extra.get("creation_time"), str):
+        extra["creation_time"] = to_epoch(dt.strptime(extra["creation_time"], Dates.DATE_FORMAT_DETAIL.value))
+    if isinstance(extra.get("next_time"), str):
+        extra["next_time"] = to_epoch(dt.strptime(extra["next_time"], Dates.DATE_FORMAT.value))
+    return extra
+
+
+def migrate_record(record: dict) -> dict:
+    """
+    Converts a task dictionary of an older version to the current one.
+    """
+    if record.get("version", 1) < RECORD_VERSION:
+        migrate_extra(record["extra"])
+        record["version"] = RECORD_VERSION
+    return record
+
+
+def record_timestamp(record: dict) -> float:
+    return record["extra"]["next_time"] / 1000000
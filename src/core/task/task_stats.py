@@ -0,0 +1,72 @@
+import time
+from bisect import bisect_left
+
+
+class Histogram:
+    """
+    Counts values in buckets with exponentially growing bounds, so recording a value is a bisect and an increment.
+    Percentiles are given as the upper bound of their bucket. Not thread safe.
+    """
+
+    def __init__(self, smallest: float = 0.001, factor: float = 2, buckets: int = 24):
+        self.bounds = [smallest * factor ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)  # the last bucket counts values above all bounds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c > 0 and seen >= rank:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                break
+        return self.max
+
+    def mean(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def summary(self) -> dict:
+        return {"count": self.count,
+                "mean": self.mean(),
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max": self.max}
+
+
+class RateCounter:
+    """
+    Counts events in a ring of one counter per second, to get the rate of the last seconds.
+    """
+
+    def __init__(self, seconds: int = 60):
+        self.counts = [0] * seconds
+        self.seconds = [0] * seconds  # second the counter belongs to
+
+    def add(self, n: int = 1):
+        second = int(time.monotonic())
+        i = second % len(self.counts)
+        if self.seconds[i] != second:
+            self.seconds[i] = second
+            self.counts[i] = 0
+        self.counts[i] += n
+
+    def rate(self) -> float:
+        now = int(time.monotonic())
+        window = len(self.counts)
+        return sum(c for c, s in zip(self.counts, self.seconds) if now - window < s <= now) / window
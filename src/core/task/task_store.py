@@ -0,0 +1,491 @@
+import os
+import json
+import sqlite3
+from itertools import islice
+from typing import Union, Iterator
+from core.database import Data
+from core.task.task_record import RECORD_VERSION, migrate_record, migrate_extra, record_timestamp
+from core.task.task_quota import TaskQuota
+from core.task.schedule import compile_schedule
+
+# fields, by which tasks can be looked up besides their author: field -> part of the task dictionary
+INDEXED_FIELDS = {"channel_id": "basic", "server_id": "basic", "type": "extra"}
+
+
+def index_add(index: dict, value, task_id: int):
+    # a single task is kept as its id, a dictionary of one entry would take several times its memory
+    ids = index.get(value)
+    if ids is None:
+        index[value] = task_id
+    elif isinstance(ids, int):
+        index[value] = {ids: None, task_id: None}
+    else:
+        ids[task_id] = None
+
+
+def index_remove(index: dict, value, task_id: int):
+    ids = index.get(value)
+    if ids == task_id:
+        del index[value]
+    elif isinstance(ids, dict):
+        ids.pop(task_id, None)
+        if len(ids) == 1:
+            index[value] = next(iter(ids))
+
+
+def index_ids(index: dict, value) -> Union[dict, tuple]:
+    ids = index.get(value, ())
+    return (ids,) if isinstance(ids, int) else ids
+
+
+def record_usage(record: dict, fires: dict) -> tuple:
+    """
+    Returns author, server and executions a day of the task. fires keeps the executions a day of every date string,
+    so the schedule is not compiled again for each task.
+    """
+    basic = record["basic"]
+    date_string = basic.get("date_string")
+    if date_string not in fires:
+        fires[date_string] = 0.0 if date_string is None else compile_schedule(date_string).daily_fires
+    return basic["author_id"], basic.get("server_id"), fires[date_string]
+
+
+class TaskJournal:
+    """
+    Persists tasks as a snapshot and an append only journal of changes.
+    Every change writes a single line, so its cost does not depend on the amount of tasks.
+    The snapshot keeps the last given id, so ids of deleted tasks are not given again.
+    The journal is merged into the snapshot, when it has grown as large as the snapshot.
+    The tasks and executions a day of every author and server are counted, while tasks are added and removed.
+    Tasks are kept as JSON text, which takes a fraction of the memory of their dictionaries.
+    Tasks of older versions are migrated while loading.
+    """
+
+    def __init__(self, data: Data, file: str = "tasks", compact_after: int = 1000, fsync: bool = False):
+        Data.check_path(data.path)
+        self.snapshot_path = f"{data.path}/{file}.json"
+        self.journal_path = f"{data.path}/{file}.journal"
+        self.compact_after = compact_after
+        self.fsync = fsync
+
+        self.records = {}  # task id -> task dictionary as JSON
+        self.authors = {}  # author id -> task id or {task id: None}, keeps insertion order
+        self.times = {}  # task id -> timestamp of next execution
+        self.indexes = {field: {} for field in INDEXED_FIELDS}  # field -> value -> task id or {task id: None}
+        self.counts = TaskQuota()  # usage of all stored tasks
+        self.fires = {}  # date string -> executions a day
+        self.last_id = 0
+        self.entries = 0  # entries in journal
+        self.journal = None
+
+    @property
+    def paths(self) -> list:
+        return [self.snapshot_path, self.journal_path]
+
+    def next_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def load(self) -> Iterator[dict]:
+        self.close()
+        self.records = {}
+        self.authors = {}
+        self.times = {}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.counts.clear()
+        self.entries = 0
+        legacy = []  # tasks saved before ids existed
+        self.last_id = 0
+        migrated = not os.path.exists(self.snapshot_path)
+        if not migrated:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            if isinstance(snapshot, list):
+                # snapshots of older versions are only a list of tasks
+                snapshot = {"last_id": 0, "tasks": snapshot}
+                migrated = True
+            self.last_id = snapshot.get("last_id", 0)
+            for record in snapshot.get("tasks", []):
+                if record.get("version") != RECORD_VERSION:
+                    migrate_record(record)
+                    migrated = True
+                if "id" in record["extra"]:
+                    self.set_record(record)
+                else:
+                    legacy.append(record)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # incomplete last line after a crash
+                    self.replay(entry)
+                    self.entries += 1
+
+        # ids of deleted tasks are not given again
+        self.last_id = max(self.last_id, max(self.records.keys(), default=0))
+        for record in legacy:
+            record["extra"]["id"] = self.next_id()
+            self.set_record(record)
+
+        # an unchanged snapshot is not written again
+        if migrated or self.entries > 0 or len(legacy) > 0:
+            self.compact()
+        return self.iter_records()
+
+    def set_record(self, record: dict) -> str:
+        # returns the JSON of the task, so it is only encoded once
+        task_id = record["extra"]["id"]
+        self.pop_record(task_id)  # a replaced task is not counted twice
+        encoded = json.dumps(record, separators=(",", ":"))
+        self.records[task_id] = encoded
+        self.counts.add(*self.record_usage(record))
+        self.times[task_id] = record_timestamp(record)
+        index_add(self.authors, record["basic"]["author_id"], task_id)
+        for field, part in INDEXED_FIELDS.items():
+            value = record[part].get(field)
+            if value is not None:
+                index_add(self.indexes[field], value, task_id)
+        return encoded
+
+    def pop_record(self, task_id: int) -> Union[dict, None]:
+        encoded = self.records.pop(task_id, None)
+        if encoded is None:
+            return None
+        record = json.loads(encoded)
+        index_remove(self.authors, record["basic"]["author_id"], task_id)
+        del self.times[task_id]
+        self.counts.remove(*self.record_usage(record))
+        for field, part in INDEXED_FIELDS.items():
+            index_remove(self.indexes[field], record[part].get(field), task_id)
+        return record
+
+    def replay(self, entry: dict):
+        if entry["op"] == "add":
+            self.set_record(migrate_record(entry["record"]))
+            self.last_id = max(self.last_id, entry["record"]["extra"]["id"])
+        elif entry["op"] == "update":
+            if entry["id"] in self.records:
+                self.set_extra(entry["id"], migrate_extra(entry["extra"]))
+        elif entry["op"] == "delete":
+            self.pop_record(entry["id"])
+
+    def append(self, line: str):
+        self.append_many([line])
+
+    def append_many(self, lines: list):
+        # every line is an entry encoded as JSON
+        if len(lines) == 0:
+            return
+        # the records are already changed, so a compaction saves the entries as well
+        if self.entries + len(lines) >= max(self.compact_after, len(self.records)):
+            self.compact()
+            return
+        if self.journal is None:
+            self.journal = open(self.journal_path, "a")
+        self.journal.write("".join(line + "\n" for line in lines))
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.entries += len(lines)
+
+    def add(self, record: dict):
+        self.add_many([record])
+
+    def add_many(self, records: list):
+        self.append_many([f'{{"op": "add", "record": {self.set_record(record)}}}' for record in records])
+
+    def update(self, task_id: int, **extra):
+        if task_id in self.records:
+            self.set_extra(task_id, extra)
+            self.append(json.dumps({"op": "update", "id": task_id, "extra": extra}))
+
+    def delete(self, task_id: int):
+        self.delete_many([task_id])
+
+    def delete_many(self, task_ids: list):
+        deleted = [i for i in task_ids if self.pop_record(i) is not None]
+        self.append_many([json.dumps({"op": "delete", "id": i}) for i in deleted])
+
+    def set_extra(self, task_id: int, extra: dict):
+        record = json.loads(self.records[task_id])
+        record["extra"].update(extra)
+        self.records[task_id] = json.dumps(record, separators=(",", ":"))
+        if "next_time" in extra:
+            self.times[task_id] = record_timestamp(record)
+
+    def get(self, task_id: int) -> Union[dict, None]:
+        encoded = self.records.get(task_id)
+        if encoded is None:
+            return None
+        return json.loads(encoded)
+
+    def iter_records(self, after: float = None, until: float = None) -> Iterator[dict]:
+        # the ids are selected first, so changes made while iterating do not disturb it
+        task_ids = [i for i, t in self.times.items() if (after is None or t > after) and (until is None or t <= until)]
+        return (json.loads(self.records[i]) for i in task_ids if i in self.records)
+
+    def author_records(self, author_id: int, offset: int = 0, limit: int = None) -> list:
+        stop = None if limit is None else offset + limit
+        return [json.loads(self.records[i]) for i in islice(index_ids(self.authors, author_id), offset, stop)]
+
+    def author_count(self, author_id: int) -> int:
+        return len(index_ids(self.authors, author_id))
+
+    def indexed_records(self, field: str, value) -> list:
+        return [json.loads(self.records[i]) for i in index_ids(self.indexes[field], value)]
+
+    def record_usage(self, record: dict) -> tuple:
+        return record_usage(record, self.fires)
+
+    def usage(self) -> dict:
+        """
+        Returns the tasks and executions a day of every author and server, (kind, id) -> [tasks, executions a day].
+        """
+        return self.counts.usage
+
+    def compact(self):
+        self.close()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f'{{"last_id":{self.last_id},"tasks":[{",".join(self.records.values())}]}}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        open(self.journal_path, "w").close()
+        self.entries = 0
+
+    def clear(self):
+        # removes all tasks, ids are given from the start again
+        self.records = {}
+        self.authors = {}
+        self.times = {}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.counts.clear()
+        self.last_id = 0
+        self.compact()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+
+class TaskDatabase:
+    """
+    Persists tasks in a SQLite database with indexes on author, next execution date and the indexed fields.
+    Tasks are loaded in chunks and tasks of one author are looked up by index. Triggers count the tasks and
+    executions a day of every author and server in the usage table, so they are not counted again while loading.
+    An existing tasks.json is imported once, when the database is empty.
+    Tasks of older versions are migrated when they are read.
+    """
+
+    chunk_size = 1000
+
+    def __init__(self, data: Data, file: str = "tasks"):
+        Data.check_path(data.path)
+        self.data = data
+        self.file = file
+        self.path = f"{data.path}/{file}.sqlite"
+        self.last_id = 0
+        self.fires = {}  # date string -> executions a day
+        self.connection: Union[sqlite3.Connection, None] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            # replaced rows fire the delete trigger
+            self.connection.execute("PRAGMA recursive_triggers=ON")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                                    "id INTEGER PRIMARY KEY, "
+                                    "author_id INTEGER NOT NULL, "
+                                    "next_time REAL NOT NULL, "
+                                    "record TEXT NOT NULL, "
+                                    "server_id INTEGER, "
+                                    "fires REAL NOT NULL DEFAULT 0)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_author_id ON tasks (author_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_next_time ON tasks (next_time)")
+            for field, part in INDEXED_FIELDS.items():
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS tasks_{field} "
+                                        f"ON tasks (json_extract(record, '$.{part}.{field}'))")
+            self.create_usage()
+            # the last given id, so ids of deleted tasks are not given again
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute("CREATE TRIGGER IF NOT EXISTS tasks_last_id AFTER INSERT ON tasks BEGIN "
+                                    "INSERT INTO meta VALUES ('last_id', NEW.id) "
+                                    "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value); "
+                                    "END")
+            self.connection.commit()
+        return self.connection
+
+    def create_usage(self):
+        connection = self.connection
+        counted = connection.execute("SELECT count(*) FROM sqlite_master WHERE name = 'usage'").fetchone()[0] > 0
+        if "fires" not in [row[1] for row in connection.execute("PRAGMA table_info(tasks)")]:
+            # databases of older versions get the columns once
+            connection.execute("ALTER TABLE tasks ADD COLUMN server_id INTEGER")
+            connection.execute("ALTER TABLE tasks ADD COLUMN fires REAL NOT NULL DEFAULT 0")
+            rows = connection.execute("SELECT id, record FROM tasks").fetchall()
+            connection.executemany("UPDATE tasks SET server_id = ?, fires = ? WHERE id = ?",
+                                   [self.row(self.decode(record))[2:4] + (task_id,) for task_id, record in rows])
+        connection.execute("CREATE TABLE IF NOT EXISTS usage ("
+                           "kind TEXT NOT NULL, "
+                           "key_id INTEGER NOT NULL, "
+                           "tasks INTEGER NOT NULL, "
+                           "fires REAL NOT NULL, "
+                           "PRIMARY KEY (kind, key_id))")
+        connection.execute("CREATE TRIGGER IF NOT EXISTS tasks_usage_insert AFTER INSERT ON tasks BEGIN "
+                           "INSERT INTO usage VALUES ('author', NEW.author_id, 1, NEW.fires) "
+                           "ON CONFLICT (kind, key_id) DO UPDATE "
+                           "SET tasks = tasks + 1, fires = fires + excluded.fires; "
+                           "INSERT INTO usage SELECT 'server', NEW.server_id, 1, NEW.fires "
+                           "WHERE NEW.server_id IS NOT NULL "
+                           "ON CONFLICT (kind, key_id) DO UPDATE "
+                           "SET tasks = tasks + 1, fires = fires + excluded.fires; "
+                           "END")
+        connection.execute("CREATE TRIGGER IF NOT EXISTS tasks_usage_delete AFTER DELETE ON tasks BEGIN "
+                           "UPDATE usage SET tasks = tasks - 1, fires = fires - OLD.fires "
+                           "WHERE (kind = 'author' AND key_id = OLD.author_id) "
+                           "OR (kind = 'server' AND key_id = OLD.server_id); "
+                           "DELETE FROM usage WHERE tasks <= 0 AND ((kind = 'author' AND key_id = OLD.author_id) "
+                           "OR (kind = 'server' AND key_id = OLD.server_id)); "
+                           "END")
+        if not counted:
+            connection.execute("INSERT INTO usage SELECT 'author', author_id, count(*), sum(fires) "
+                               "FROM tasks GROUP BY author_id")
+            connection.execute("INSERT INTO usage SELECT 'server', server_id, count(*), sum(fires) "
+                               "FROM tasks WHERE server_id IS NOT NULL GROUP BY server_id")
+
+    @property
+    def paths(self) -> list:
+        return [self.path, f"{self.path}-wal", f"{self.path}-shm"]
+
+    def next_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def load(self) -> Iterator[dict]:
+        connection = self.connect()
+        # the tasks of the journal are imported once, later they may have been deleted on purpose
+        if connection.execute("SELECT count(*) FROM meta WHERE key = 'imported'").fetchone()[0] == 0:
+            if connection.execute("SELECT count(*) FROM tasks").fetchone()[0] == 0:
+                self.import_json()
+            with connection:
+                connection.execute("INSERT INTO meta VALUES ('imported', 1)")
+        self.last_id = connection.execute("SELECT max(coalesce((SELECT value FROM meta WHERE key = 'last_id'), 0), "
+                                          "coalesce((SELECT max(id) FROM tasks), 0))").fetchone()[0]
+        return self.iter_records()
+
+    def import_json(self):
+        journal = TaskJournal(self.data, self.file)
+        if not os.path.exists(journal.snapshot_path) and not os.path.exists(journal.journal_path):
+            return
+        records = journal.load()
+        with self.connect() as connection:
+            connection.executemany(self.insert, [self.row(r) for r in records])
+            connection.execute("INSERT INTO meta VALUES ('last_id', ?) "
+                               "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)", (journal.last_id,))
+
+    columns = "tasks (id, author_id, server_id, fires, next_time, record) VALUES (?, ?, ?, ?, ?, ?)"
+    insert = f"INSERT INTO {columns}"
+    replace = f"INSERT OR REPLACE INTO {columns}"
+
+    def row(self, record: dict) -> tuple:
+        author_id, server_id, fires = self.record_usage(record)
+        return (record["extra"]["id"],
+                author_id,
+                server_id,
+                fires,
+                record_timestamp(record),
+                json.dumps(record))
+
+    def iter_records(self, after: float = None, until: float = None) -> Iterator[dict]:
+        # chunks are selected by id, so changes made while iterating do not disturb the query
+        after = float("-inf") if after is None else after
+        until = float("inf") if until is None else until
+        last = 0
+        while True:
+            rows = self.connect().execute("SELECT id, record FROM tasks "
+                                          "WHERE id > ? AND next_time > ? AND next_time <= ? "
+                                          "ORDER BY id LIMIT ?",
+                                          (last, after, until, self.chunk_size)).fetchall()
+            if len(rows) == 0:
+                return
+            for task_id, record in rows:
+                yield self.decode(record)
+            last = rows[-1][0]
+
+    @staticmethod
+    def decode(record: str) -> dict:
+        return migrate_record(json.loads(record))
+
+    def add(self, record: dict):
+        with self.connect() as connection:
+            connection.execute(self.replace, self.row(record))
+
+    def add_many(self, records: list):
+        with self.connect() as connection:
+            connection.executemany(self.replace, [self.row(r) for r in records])
+
+    def update(self, task_id: int, **extra):
+        record = self.get(task_id)
+        if record is not None:
+            record["extra"].update(extra)
+            with self.connect() as connection:
+                connection.execute("UPDATE tasks SET next_time = ?, record = ? WHERE id = ?",
+                                   (record_timestamp(record), json.dumps(record), task_id))
+
+    def delete(self, task_id: int):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def delete_many(self, task_ids: list):
+        with self.connect() as connection:
+            connection.executemany("DELETE FROM tasks WHERE id = ?", [(i,) for i in task_ids])
+
+    def get(self, task_id: int) -> Union[dict, None]:
+        row = self.connect().execute("SELECT record FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        return self.decode(row[0])
+
+    def author_records(self, author_id: int, offset: int = 0, limit: int = None) -> list:
+        rows = self.connect().execute("SELECT record FROM tasks WHERE author_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                                      (author_id, -1 if limit is None else limit, offset)).fetchall()
+        return [self.decode(row[0]) for row in rows]
+
+    def author_count(self, author_id: int) -> int:
+        return self.connect().execute("SELECT count(*) FROM tasks WHERE author_id = ?", (author_id,)).fetchone()[0]
+
+    def indexed_records(self, field: str, value) -> list:
+        part = INDEXED_FIELDS[field]
+        rows = self.connect().execute(f"SELECT record FROM tasks WHERE json_extract(record, '$.{part}.{field}') = ? "
+                                      "ORDER BY id", (value,)).fetchall()
+        return [self.decode(row[0]) for row in rows]
+
+    def record_usage(self, record: dict) -> tuple:
+        return record_usage(record, self.fires)
+
+    def usage(self) -> dict:
+        """
+        Returns the tasks and executions a day of every author and server, (kind, id) -> [tasks, executions a day].
+        """
+        rows = self.connect().execute("SELECT kind, key_id, tasks, fires FROM usage").fetchall()
+        return {(kind, key_id): [tasks, fires] for kind, key_id, tasks, fires in rows}
+
+    def compact(self):
+        self.connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self):
+        # removes all tasks, ids are given from the start again
+        with self.connect() as connection:
+            connection.execute("DELETE FROM tasks")
+            connection.execute("DELETE FROM meta WHERE key = 'last_id'")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -4,6 +4,7 @@ from discord import DMChannel
 from discord.ext import commands
 import random
 import asyncio
+from typing import Union
 from core.version import __version__
 from core.enums import Dates
 from core.permissions import is_group_member, is_owner
@@ -76,6 +77,7 @@ class Misc(commands.Cog):
             label = message
         t = self.bot.ipc.pack(author_id=ctx.message.author.id,
                               channel_id=ctx.message.channel.id,
+                              server_id=ctx.guild.id if ctx.guild is not None else None,
                               message=message,
                               message_args=message_args,
                               date_string=date_string,
@@ -90,6 +92,49 @@ class Misc(commands.Cog):
                           channel_id=ctx.message.channel.id
                           )
 
+    @commands.command("rmdall")
+    @commands.check_any(commands.check(is_owner),
+                        commands.check(is_group_member("taskExtra")))
+    async def remind_all(self, ctx, date_string, message,
+                         *targets: Union[discord.Member, discord.Role, discord.TextChannel]):
+        """
+        Adds one reminder for many members.
+
+        targets:
+            Members and at most one role to remind. Each of them gets a direct message,
+            unless a channel is given, then they are mentioned there.
+
+        Run 'help tasks' to get more information.
+        """
+        if ctx.guild is None:
+            raise RuntimeError("This command can only be used on a server.")
+        user_ids = [t.id for t in targets if isinstance(t, discord.Member)]
+        roles = [t.id for t in targets if isinstance(t, discord.Role)]
+        channels = [t.id for t in targets if isinstance(t, discord.TextChannel)]
+        if len(roles) > 1 or len(channels) > 1:
+            raise RuntimeError("You can give one role and one channel at most.")
+        if len(user_ids) == 0 and len(roles) == 0:
+            raise RuntimeError("Nobody to remind.")
+
+        t = self.bot.ipc.pack(author_id=ctx.message.author.id,
+                              channel_id=channels[0] if len(channels) > 0 else None,
+                              server_id=ctx.guild.id,
+                              message=message,
+                              message_args="p" if len(channels) > 0 else "",
+                              date_string=date_string,
+                              label=message,
+                              number=0,
+                              user_ids=user_ids,
+                              role_id=roles[0] if len(roles) > 0 else None
+                              )
+
+        self.bot.ipc.send(dst="task",
+                          package=t, cmd="task",
+                          task="FanOutReminder",
+                          author_id=ctx.message.author.id,
+                          channel_id=ctx.message.channel.id
+                          )
+
     @commands.command()
     async def info(self, ctx):
         """
@@ -17,16 +17,24 @@ class Main:
         self.bot_token = ""
         self.greetings()
 
+        # every shard is a task manager process, that owns the tasks of some authors
+        self.global_config.set_default_config("taskShards", "Tasks", "1")
+        shards = int(self.global_config.get_config("taskShards", "Tasks"))
+
         self.ipc = IPC()
-        self.ipc.create_queues("bot", "task")
+        self.ipc.create_queues("bot")
+        self.ipc.create_shards("task", shards)
 
         self.bot = BotClient(self.data, self.global_config, self.ipc)
-        self.task_manager = TaskManager(self.data, self.ipc)
+        self.task_managers = [TaskManager(self.data, self.ipc, self.global_config, shard=i, shards=shards)
+                              for i in range(shards)]
 
     def run(self):
         self.global_config.set_default_config("restartOnErrorTimer", "System", "120")
         timer = float(self.global_config.get_config("restartOnErrorTimer", "System"))
-        self.task_manager.start()
+        self.task_managers[0].reshard()
+        for task_manager in self.task_managers:
+            task_manager.start()
         try:
             self.bot.run(self.bot_token, reconnect=True)
 
@@ -40,8 +48,9 @@ class Main:
                 return
 
         t = self.ipc.pack()
-        self.ipc.send(dst="task", package=t, cmd="stop")
-        self.task_manager.join()
+        self.ipc.send(dst="task", package=t, cmd="stop")  # sent to every shard
+        for task_manager in self.task_managers:
+            task_manager.join()
 
         if self.bot.restart:
             restart(sys.argv, float(self.global_config.get_config("restartTimer", "System")))
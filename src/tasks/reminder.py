@@ -4,6 +4,9 @@ from core.task import task
 
 @task("Reminder")
 class Reminder(TimeBasedTask):
+
+    __slots__ = ("message", "message_args")
+
     def __init__(self, *, author_id, channel_id, server_id=None, date_string, number, label, message, message_args):
         TimeBasedTask.__init__(self, author_id=author_id,
                                channel_id=channel_id,
@@ -16,3 +19,33 @@ class Reminder(TimeBasedTask):
 
     def run(self):
         return "send", self.message, self.message_args
+
+
+@task("FanOutReminder")
+class FanOutReminder(TimeBasedTask):
+    """
+    A reminder for many users, that is saved and scheduled once. The bot expands a role into its members,
+    when the reminder is delivered.
+    """
+
+    __slots__ = ("message", "message_args", "user_ids", "role_id")
+
+    def __init__(self, *, author_id, channel_id, server_id=None, date_string, number, label, message, message_args,
+                 user_ids=(), role_id=None):
+        TimeBasedTask.__init__(self, author_id=author_id,
+                               channel_id=channel_id,
+                               server_id=server_id,
+                               date_string=date_string,
+                               label=label,
+                               number=number)
+        if len(user_ids) == 0 and role_id is None:
+            raise ValueError("A fan out reminder needs users or a role")
+        self.message = message
+        self.message_args = message_args
+        self.user_ids = list(user_ids)
+        self.role_id = role_id
+
+    def run(self):
+        return "fan_out", self.message, self.message_args, {"user_ids": self.user_ids,
+                                                            "role_id": self.role_id,
+                                                            "server_id": self.server_id}
@@ -1,9 +1,22 @@
 from core.task import TimeBasedTask
 from core.task import task
+from core.enums import CatchUp, Priority
 
 
 @task("Shutdown")
 class ShutdownTask(TimeBasedTask):
+
+    __slots__ = ("mode",)
+
+    # a missed shutdown or restart must not be executed late
+    catch_up = CatchUp.SKIP
+
+    # it is executed at its exact date, never spread
+    spread = 0
+
+    # and never waits behind user tasks
+    priority = Priority.SYSTEM
+
     def __init__(self, *, author_id, channel_id=None, server_id=None, date_string, mode):
         TimeBasedTask.__init__(self,
                                author_id=author_id,
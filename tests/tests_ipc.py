@@ -0,0 +1,32 @@
+from unittest import TestCase
+from core.system import IPC
+
+
+class IPCTests(TestCase):
+    ipc: IPC
+
+    def setUp(self) -> None:
+        self.ipc = IPC()
+        self.ipc.create_queues("bot")
+        self.ipc.create_shards("task", 3)
+
+    def test_routed_by_author(self):
+        for author_id in range(6):
+            self.ipc.send(dst="task", package=self.ipc.pack(), cmd="task", author_id=author_id)
+
+        for shard in range(3):
+            packages = [self.ipc.check_queue_timeout(f"task{shard}", 1) for _ in range(2)]
+            self.assertEqual([shard, shard + 3], [p.author_id for p in packages])
+
+    def test_package_without_author_sent_to_all_shards(self):
+        self.ipc.send(dst="task", package=self.ipc.pack(), cmd="stop")
+
+        for shard in range(3):
+            self.assertEqual("stop", self.ipc.check_queue_timeout(f"task{shard}", 1).cmd)
+
+    def test_single_shard_keeps_name(self):
+        ipc = IPC()
+        ipc.create_shards("task", 1)
+        ipc.send(dst="task", package=ipc.pack(), cmd="stop")
+
+        self.assertEqual("stop", ipc.check_queue_timeout("task", 1).cmd)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+from datetime import datetime as dt, timedelta as td
+from croniter import croniter as cr
+from core.task.schedule import compile_schedule, CronSchedule, IntervalSchedule
+from core.task.task_exceptions import TaskCreationError
+
+
+class ScheduleTests(TestCase):
+
+    def test_schedules_shared(self):
+        self.assertIs(compile_schedule("0 8 * * *"), compile_schedule("0 8 * * *"))
+        self.assertIs(compile_schedule("1h30m"), compile_schedule("1h30m"))
+
+    def test_schedule_types(self):
+        self.assertIsInstance(compile_schedule("* * * * *"), CronSchedule)
+        self.assertIsInstance(compile_schedule("2h45m17s"), IntervalSchedule)
+        self.assertEqual(td(hours=2, minutes=45, seconds=17), compile_schedule("2h45m17s").delta)
+
+    def test_bad_date_strings(self):
+        for date_string in ["0s", "1h2h", "abc", "5", "h", "61 * * * *"]:
+            self.assertRaises(TaskCreationError, compile_schedule, date_string)
+
+    def test_cron_min_interval(self):
+        start = dt(2021, 1, 1, 12, 0, 30)
+        for date_string in ["* * * * *", "*/5 * * * *", "0 */3 * * *"]:
+            for min_interval in [0, 1, 7, 60, 200]:
+                dates = cr(date_string, start)
+                right_date = dates.get_next(dt)
+                while right_date - start < td(minutes=min_interval):
+                    right_date = dates.get_next(dt)
+
+                self.assertEqual(right_date, compile_schedule(date_string).next_date(start, min_interval))
+
+    def test_interval_catch_up(self):
+        start = dt.now().replace(microsecond=0) - td(minutes=120)
+        next_time = compile_schedule("119m").next_date(start)
+
+        self.assertTrue(next_time >= dt.now() - td(seconds=1))
+        self.assertTrue(next_time <= dt.now() + td(minutes=119))
+
+    def test_following_date_not_skipped(self):
+        start = dt(2021, 1, 1, 12, 0, 30)
+
+        self.assertEqual(start + td(minutes=90), compile_schedule("1h30m").following_date(start))
+        self.assertEqual(dt(2021, 1, 1, 12, 5), compile_schedule("*/5 * * * *").following_date(start))
+
+    def test_daily_fires(self):
+        self.assertEqual(1440, compile_schedule("* * * * *").daily_fires)
+        self.assertEqual(24, compile_schedule("*/5 8,9 * * 1-5").daily_fires)
+        self.assertEqual(16, compile_schedule("1h30m").daily_fires)
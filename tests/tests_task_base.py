@@ -1,3 +1,4 @@
+import pickle
 from unittest import TestCase
 from datetime import datetime as dt, timedelta as td
 from tasks.reminder import Reminder
@@ -115,3 +116,18 @@ class TaskTests(TestCase):
 
         task.calc_counter()
         self.assertTrue(task.delete)
+
+    def test_pickle_without_dict(self):
+        task: Reminder = self.Rem(author_id=0,
+                                  channel_id=0,
+                                  date_string="5h",
+                                  number=5,
+                                  label="test",
+                                  message="test",
+                                  message_args="")
+        copy = pickle.loads(pickle.dumps(task))
+
+        self.assertFalse(hasattr(task, "__dict__"))
+        self.assertEqual(task.next_time, copy.next_time)
+        self.assertEqual("5h", copy.date_string)
+        self.assertEqual(("send", "test", ""), copy.run())
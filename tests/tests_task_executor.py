@@ -0,0 +1,133 @@
+import os
+import time
+from threading import Event
+from unittest import TestCase
+from core.task import TimeBasedTask, task
+from core.task.task_executor import ExecutorPool, ProcessPool
+from core.task.task_history import FireHistory
+from datetime import datetime as dt
+from core.system import IPC
+
+
+class DummyTask:
+    timeout = None
+    cpu_bound = False
+    author_id = 0
+    channel_id = 0
+    task_id = 1
+
+    def __init__(self, block: Event = None):
+        self.block = block
+
+    def execute(self):
+        if self.block is not None:
+            self.block.wait()
+        return "send", "test", ""
+
+
+@task("CpuBound")
+class CpuBoundTask(TimeBasedTask):
+    cpu_bound = True
+
+    def run(self):
+        return "send", str(os.getpid()), ""
+
+
+class ExecutorPoolTests(TestCase):
+    ipc: IPC
+    pool: ExecutorPool
+
+    def setUp(self) -> None:
+        self.ipc = IPC()
+        self.ipc.create_queues("bot")
+        self.pool = ExecutorPool(self.ipc, workers=2, queue_size=10, timeout=0.1)
+        self.release = Event()
+
+    def tearDown(self) -> None:
+        self.release.set()
+        self.pool.stop(1)
+
+    def test_results_sent_to_bot(self):
+        for _ in range(5):
+            self.pool.submit(DummyTask())
+        messages = [self.ipc.check_queue_timeout("bot", 1) for _ in range(5)]
+
+        self.assertTrue(all(m is not None and m.message == "test" for m in messages))
+
+    def test_durations_recorded(self):
+        for _ in range(5):
+            self.pool.submit(DummyTask())
+        self.pool.stop(1)
+        stats = self.pool.get_stats()
+
+        self.assertEqual(5, stats["executed"])
+        self.assertEqual(5, stats["durations"]["count"])
+
+    def test_hanging_task_replaced(self):
+        self.pool.submit(DummyTask(self.release))
+        time.sleep(2.5)
+        self.pool.submit(DummyTask())
+        messages = [self.ipc.check_queue_timeout("bot", 1) for _ in range(2)]
+
+        self.assertEqual(1, self.pool.timed_out)
+        self.assertEqual(2, len(self.pool.workers))
+        self.assertEqual({"Your task was cancelled, because it took too long.", "test"},
+                         {m.message for m in messages})
+
+    def test_stop_does_not_wait_for_hanging_task(self):
+        self.pool.timeout = 60
+        self.pool.submit(DummyTask(self.release))
+        start = time.monotonic()
+        self.pool.stop(0.5)
+
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_cpu_bound_task_executed_in_other_process(self):
+        self.pool.timeout = 60
+        self.pool.submit(CpuBoundTask.task_class(author_id=0, date_string="1h"))
+        message = self.ipc.check_queue_timeout("bot", 10)
+
+        self.assertIsNotNone(message)
+        self.assertNotEqual(str(os.getpid()), message.message)
+
+    def test_shared_process_pool_kept_running(self):
+        process_pool = ProcessPool(1)
+        pools = [ExecutorPool(self.ipc, workers=1, timeout=60, process_pool=process_pool) for _ in range(2)]
+        try:
+            for pool in pools:
+                pool.submit(CpuBoundTask.task_class(author_id=0, date_string="1h"))
+            messages = [self.ipc.check_queue_timeout("bot", 10) for _ in range(2)]
+            pools[0].stop(1)
+
+            # one process executed the tasks of both pools
+            self.assertEqual(1, len({m.message for m in messages}))
+            self.assertIsNotNone(process_pool.executor)
+        finally:
+            for pool in pools:
+                pool.stop(1)
+            process_pool.shutdown()
+
+    def test_extra_arguments_sent_to_bot(self):
+        task = DummyTask()
+        task.execute = lambda: ("fan_out", "test", "", {"user_ids": [1, 2], "role_id": None})
+        self.pool.submit(task)
+        message = self.ipc.check_queue_timeout("bot", 1)
+
+        self.assertEqual("fan_out", message.cmd)
+        self.assertEqual([1, 2], message.user_ids)
+        self.assertIsNone(message.role_id)
+
+    def test_executions_recorded(self):
+        self.pool.history = FireHistory()
+        scheduled = dt(2021, 1, 1, 8)
+        self.pool.submit(DummyTask(), scheduled)
+        failing = DummyTask()
+        failing.execute = lambda: 1 / 0
+        self.pool.submit(failing, scheduled)
+        self.pool.submit(DummyTask())  # not recorded without a date
+        self.pool.stop(1)
+        executions = self.pool.history.query(0)
+
+        self.assertEqual(["error", "ok"], sorted(e["outcome"] for e in executions))
+        self.assertTrue(all(e["scheduled"] == scheduled for e in executions))
+        self.assertTrue(all(e["started"] > scheduled for e in executions))
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from datetime import datetime as dt
+from core.task.task_history import FireHistory
+from core.task.task_record import to_epoch
+from core.database import Data
+
+
+class FireHistoryTests(TestCase):
+
+    def setUp(self) -> None:
+        self.data = Data(tempfile.mkdtemp())
+        self.path = f"{self.data.path}/fire_history_test.bin"
+        self.remove()
+
+    def tearDown(self) -> None:
+        self.remove()
+        shutil.rmtree(self.data.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def fire(history: FireHistory, task_id: int, author_id: int = 1, outcome: int = FireHistory.OK):
+        date = dt(2021, 1, 1, 8, 0, task_id % 60)
+        history.record(task_id, author_id, date, to_epoch(date) / 1000000 + 0.0015, 0.25, outcome)
+
+    def test_latest_executions_kept(self):
+        history = FireHistory(size=5)
+        for i in range(1, 9):
+            self.fire(history, i)
+
+        self.assertEqual(5, len(history.pending))
+        self.assertEqual([8, 7, 6, 5, 4], [e["task_id"] for e in history.query(1)])
+        self.assertEqual(0, len(history.pending))
+        self.assertEqual([8, 7], [e["task_id"] for e in history.query(1, limit=2)])
+        self.assertEqual([], history.query(1, task_id=3))
+
+    def test_query_by_author_and_task(self):
+        history = FireHistory(size=10)
+        self.fire(history, 1, author_id=1)
+        self.fire(history, 2, author_id=2, outcome=FireHistory.TIMEOUT)
+        self.fire(history, 1, author_id=1, outcome=FireHistory.ERROR)
+        executions = history.query(1, task_id=1)
+
+        self.assertEqual(["error", "ok"], [e["outcome"] for e in executions])
+        self.assertEqual(dt(2021, 1, 1, 8, 0, 1), executions[0]["scheduled"])
+        self.assertEqual(dt(2021, 1, 1, 8, 0, 1, 1500), executions[0]["started"])
+        self.assertEqual(0.25, executions[0]["duration"])
+        self.assertEqual(["timed out"], [e["outcome"] for e in history.query(2)])
+
+    def test_history_survives_restart(self):
+        history = FireHistory(self.path, size=5)
+        history.load()
+        for i in range(1, 9):
+            self.fire(history, i)
+        history.close()
+
+        self.assertEqual(5 * FireHistory.layout.size, os.path.getsize(self.path))
+        history = FireHistory(self.path, size=5)
+        history.load()
+        self.fire(history, 9)
+        self.assertEqual([9, 8, 7, 6, 5], [e["task_id"] for e in history.query(1)])
+        history.close()
+
+        # a smaller history keeps the latest executions
+        history = FireHistory(self.path, size=3)
+        history.load()
+        self.assertEqual([9, 8, 7], [e["task_id"] for e in history.query(1)])
+        self.assertEqual(3 * FireHistory.layout.size, os.path.getsize(self.path))
+        history.close()
@@ -0,0 +1,61 @@
+from unittest import TestCase
+from datetime import datetime as dt, timedelta as td
+from croniter import croniter as cr
+from core.task.task_import import task_dates
+from core.task.task_record import RECORD_VERSION, to_epoch
+
+
+def make_record(date_string: str, next_time: dt, delete: bool = False, min_interval: int = 0) -> dict:
+    basic = {"author_id": 0, "date_string": date_string}
+    if min_interval != 0:
+        basic["min_interval"] = min_interval
+    return {"version": RECORD_VERSION,
+            "basic": basic,
+            "extra": {"id": 1,
+                      "type": "Reminder",
+                      "creation_time": to_epoch(dt(2021, 1, 25, 5, 20, 0, 123456)),
+                      "next_time": to_epoch(next_time),
+                      "delete": delete,
+                      "counter": -1}}
+
+
+class TaskImportTests(TestCase):
+
+    def setUp(self) -> None:
+        self.now = dt.now().replace(microsecond=0)
+
+    def test_creation_time(self):
+        creation_time, _, _ = task_dates([make_record("1h", self.now)], self.now)[0]
+
+        self.assertEqual(dt(2021, 1, 25, 5, 20, 0, 123456), creation_time)
+
+    def test_future_task_unchanged(self):
+        next_time = self.now + td(hours=3)
+        _, new_next_time, changed = task_dates([make_record("1h", next_time)], self.now)[0]
+
+        self.assertEqual(next_time, new_next_time)
+        self.assertFalse(changed)
+
+    def test_finished_task(self):
+        _, next_time, _ = task_dates([make_record("1h", self.now - td(hours=3), delete=True)], self.now)[0]
+
+        self.assertIsNone(next_time)
+
+    def test_interval_task_caught_up(self):
+        last = self.now - td(minutes=200)
+        _, next_time, changed = task_dates([make_record("1h", last)], self.now)[0]
+
+        delta = td(hours=1)
+        self.assertEqual(self.now + delta % (self.now - (last + delta)), next_time)
+        self.assertTrue(changed)
+
+    def test_cron_tasks_caught_up(self):
+        records = [make_record("*/5 * * * *", self.now - td(days=i)) for i in range(1, 4)]
+        records.append(make_record("0 8 * * *", self.now - td(days=1)))
+        records.append(make_record("* * * * *", self.now - td(days=1), min_interval=30))
+        dates = task_dates(records, self.now)
+
+        every_five_minutes = cr("*/5 * * * *", self.now).get_next(dt)
+        self.assertEqual([every_five_minutes] * 3, [d[1] for d in dates[:3]])
+        self.assertEqual(cr("0 8 * * *", self.now).get_next(dt), dates[3][1])
+        self.assertEqual(cr("* * * * *", self.now + td(minutes=30) - td(microseconds=1)).get_next(dt), dates[4][1])
@@ -1,9 +1,20 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import Union
+from threading import Event
 from unittest import TestCase
 from datetime import datetime as dt, timedelta as td
 from core.task.task_control import TaskManager
+from core.task.task_executor import ExecutorPool
+from core.task.task_store import TaskJournal, TaskDatabase
 from core.system import IPC
 from core.database import Data
 from core.containers import TransferPackage
+from core.enums import CatchUp, Priority
+from core.task.task_exceptions import UserHasNoTasksException, TaskIdDoesNotExistException, TaskCreationError
+from tests_task_executor import DummyTask
 
 
 class TaskManagerTests(TestCase):
@@ -15,7 +26,7 @@ class TaskManagerTests(TestCase):
     def setUp(self) -> None:
         self.ipc = IPC()
         self.ipc.create_queues("bot", "task")
-        self.data = Data()
+        self.data = Data(tempfile.mkdtemp())
         self.tm = TaskManager(data=self.data, ipc=self.ipc)
         self.tm.paths = {"../src/tasks": "tasks"}
         self.tm.register_all_tasks()
@@ -39,7 +50,9 @@ class TaskManagerTests(TestCase):
         self.tm.add_task(self.t)
 
     def tearDown(self) -> None:
-        self.data.set_json(file="tasks", data=[])
+        self.tm.store.clear()
+        self.tm.store.close()
+        shutil.rmtree(self.data.path)
 
     def test_add_task_right_next_date(self):
         self.tm.add_task(self.t)
@@ -94,7 +107,7 @@ class TaskManagerTests(TestCase):
         self.assertEqual(self.tm.next_date, right_next_time, msg="Wrong next date")
 
     def test_remove_only_task_right_date(self):
-        task = self.tm.get_task(0, 0)
+        task = self.tm.get_task(1, 0)
         self.tm.delete_task(task)
 
         self.assertEqual(None, self.tm.next_date)
@@ -118,7 +131,7 @@ class TaskManagerTests(TestCase):
                  )
 
         self.tm.add_task(t2)
-        task = self.tm.get_task(0, 0)
+        task = self.tm.get_task(1, 0)
         self.tm.delete_task(task)
         right_next_time = dt.now().replace(microsecond=0) + td(hours=2)
 
@@ -143,7 +156,7 @@ class TaskManagerTests(TestCase):
                  )
 
         self.tm.add_task(t2)
-        task = self.tm.get_task(1, 0)
+        task = self.tm.get_task(2, 0)
         self.tm.delete_task(task)
         right_next_time = dt.now().replace(microsecond=0) + td(hours=1)
 
@@ -216,10 +229,9 @@ class TaskManagerTests(TestCase):
         self.tm.add_task(t2)
         right_next_time = dt.now().replace(microsecond=0) + td(minutes=30)
         self.tm.next_date = None
-        while not self.tm.task_queue.empty():
-            self.tm.task_queue.get()
+        self.tm.task_queue.clear()
         self.tm.tasks = {}
-        self.tm.import_tasks(self.data.get_json(file="tasks"))
+        self.tm.import_tasks(self.tm.store.load())
 
         self.assertEqual(right_next_time, self.tm.next_date)
 
@@ -246,3 +258,452 @@ class TaskManagerTests(TestCase):
         self.tm.delete_all_tasks(1)
 
         self.assertEqual(None, self.tm.next_date)
+
+    def reminder(self, author_id: int, date_string: str, number: int = 0) -> dict:
+        return {"task": "Reminder",
+                "kwargs": {"author_id": author_id,
+                           "channel_id": 0,
+                           "message": "test",
+                           "message_args": "",
+                           "date_string": date_string,
+                           "label": "test",
+                           "number": number}}
+
+    def add_reminder(self, author_id: int, date_string: str, number: int = 0):
+        reminder = self.reminder(author_id, date_string, number)
+        t2 = TransferPackage()
+        t2.pack(**reminder["kwargs"])
+        t2.label(dst="task",
+                 cmd="task",
+                 task=reminder["task"],
+                 author_id=author_id,
+                 channel_id=0
+                 )
+
+        self.tm.add_task(t2)
+
+    def make_late(self, date_string: str, late: td, number: int = 0):
+        self.add_reminder(1, date_string, number)
+        task = self.tm.get_task(max(self.tm.tasks[1]), 1)
+        task._next_time = (dt.now() - late).replace(second=0, microsecond=0)
+        self.tm.queue_task(task)
+        self.tm.set_next_date()
+        return task
+
+    def collect_executions(self) -> list:
+        executed = []
+        self.tm.start_executor = executed.append
+        return executed
+
+    def test_due_tasks_executed_in_one_loop(self):
+        tasks = [self.make_late("* * * * *", td(seconds=0)) for _ in range(3)]
+        for task in tasks:
+            task._next_time = dt.now()
+            self.tm.queue_task(task)
+        self.tm.set_next_date()
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(3, len(executed))
+        self.assertTrue(self.tm.next_date > dt.now())
+
+    def test_lag_recorded(self):
+        self.make_late("* * * * *", td(minutes=2))
+        self.collect_executions()
+        self.tm.tasks_loop()
+        stats = self.tm.get_stats()
+
+        self.assertEqual(1, stats["lag"]["count"])
+        self.assertTrue(stats["lag"]["max"] >= 120)
+        self.assertEqual(1, stats["backlog"]["count"])
+        self.assertEqual(2, stats["queued"])
+
+    def test_late_task_skipped(self):
+        self.tm.catch_up = CatchUp.SKIP
+        task = self.make_late("* * * * *", td(minutes=10))
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(0, len(executed))
+        self.assertTrue(task.next_time > dt.now())
+
+    def test_late_task_executed_once(self):
+        self.tm.catch_up = CatchUp.ONCE
+        task = self.make_late("* * * * *", td(minutes=10))
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(1, len(executed))
+        self.assertTrue(task.next_time > dt.now())
+
+    def test_late_task_executed_for_every_missed_date(self):
+        self.tm.catch_up = CatchUp.ALL
+        task = self.make_late("* * * * *", td(minutes=10))
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(11, len(executed))
+        self.assertTrue(task.next_time > dt.now())
+
+    def test_late_interval_task_executed_for_every_missed_date(self):
+        self.tm.catch_up = CatchUp.ALL
+        task = self.make_late("1m", td(minutes=10), number=100)
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(11, len(executed))
+        self.assertTrue(task.next_time > dt.now())
+
+    def reload_with_horizon(self, hours: Union[float, None]):
+        self.tm.horizon = None if hours is None else td(hours=hours)
+        self.tm.task_queue.clear()
+        self.tm.tasks = {}
+        self.tm.loaded = {}
+        self.tm.store.load()
+        self.tm.load_tasks()
+
+    def test_tasks_outside_horizon_not_loaded(self):
+        self.add_reminder(1, "50h")
+        self.reload_with_horizon(24)
+
+        self.assertEqual(1, len(self.tm.loaded))
+        self.assertEqual(1, len(self.tm.task_queue))
+        self.assertEqual(1, len(self.tm.get_tasks(1)))
+
+    def test_new_task_outside_horizon_not_loaded(self):
+        self.reload_with_horizon(24)
+        self.add_reminder(1, "50h")
+
+        self.assertEqual(1, len(self.tm.loaded))
+        self.assertEqual(1, len(self.tm.get_tasks(1)))
+
+    def test_refill(self):
+        self.add_reminder(1, "50h")
+        self.reload_with_horizon(24)
+        self.tm.loaded_until = dt.now() + td(hours=1)
+        self.tm.horizon = td(hours=60)
+        self.tm.refill_tasks()
+
+        self.assertEqual(2, len(self.tm.loaded))
+        self.assertEqual(2, len(self.tm.task_queue))
+
+    def test_horizon_only_with_database(self):
+        store = self.tm.store
+        self.tm.store = TaskDatabase(self.data, "tasks_horizon")
+        self.assertEqual(td(hours=24), self.tm.load_horizon())
+        self.tm.store.close()
+        self.tm.store = TaskJournal(self.data, "tasks_horizon")
+        self.assertIsNone(self.tm.load_horizon())
+        self.tm.store = store
+
+    def test_all_tasks_loaded_without_horizon(self):
+        self.add_reminder(1, "50h")
+        self.reload_with_horizon(None)
+
+        self.assertEqual(2, len(self.tm.loaded))
+        self.assertIsNone(self.tm.loaded_until)
+        self.assertIsNone(self.tm.refill_time())
+
+    def test_delete_task_outside_horizon(self):
+        self.add_reminder(1, "50h")
+        self.reload_with_horizon(24)
+        task = self.tm.get_task(2, 1)
+        self.tm.delete_task(task)
+
+        self.assertRaises(UserHasNoTasksException, self.tm.get_tasks, 1)
+        self.assertEqual(1, len(self.tm.task_queue))
+
+    def test_reshard(self):
+        for author_id in [1, 2, 3, 3]:
+            self.add_reminder(author_id, "1h")
+        self.tm.store.close()
+        shards = [TaskManager(data=self.data, ipc=self.ipc, shard=i, shards=2) for i in range(2)]
+        for tm in shards:
+            tm.paths = {"../src/tasks": "tasks"}
+            tm.register_all_tasks()
+        shards[0].reshard()
+        try:
+            for tm in shards:
+                tm.import_tasks(tm.store.load())
+
+            self.assertEqual([0, 2], sorted(shards[0].tasks.keys()))
+            self.assertEqual([1, 3], sorted(shards[1].tasks.keys()))
+            self.assertEqual([1, 2, 3], sorted(shards[1].loaded.keys()))
+            self.assertEqual(2, len(shards[1].get_tasks(3)))
+        finally:
+            # tasks are moved back, so tearDown clears them
+            for tm in shards:
+                tm.store.close()
+            self.tm.reshard()
+            for file in os.listdir(self.data.path):
+                if file.startswith("tasks_") or file == "task_shards":
+                    os.remove(f"{self.data.path}/{file}")
+            self.tm.store.load()
+
+    def test_reshard_interrupted(self):
+        def crash(path):
+            raise OSError("crashed")
+
+        for author_id in [1, 2]:
+            self.add_reminder(author_id, "1h")
+        self.tm.store.close()
+        tm = TaskManager(data=self.data, ipc=self.ipc, shards=2)
+        tm.move_stores = crash
+        self.assertRaises(OSError, tm.reshard)
+        try:
+            # the old store is intact, until the moves are carried out
+            store = self.tm.create_store("tasks")
+            self.assertEqual(3, len(list(store.load())))
+            store.close()
+            self.assertFalse(os.path.exists(f"{self.data.path}/task_shards"))
+
+            del tm.move_stores
+            tm.reshard()
+            stores = [tm.create_store(f"tasks_{i}") for i in range(2)]
+            self.assertEqual(3, sum(len(list(store.load())) for store in stores))
+            for store in stores:
+                store.close()
+            self.assertEqual([], [f for f in os.listdir(self.data.path) if f.startswith("resharding_")])
+        finally:
+            self.tm.reshard()
+            for file in os.listdir(self.data.path):
+                if file.startswith("tasks_") or file == "task_shards":
+                    os.remove(f"{self.data.path}/{file}")
+            self.tm.store.load()
+
+    def test_ids_stable_after_delete(self):
+        for _ in range(3):
+            self.add_reminder(1, "1h")
+        self.tm.delete_task(self.tm.get_task(2, 1))
+
+        self.assertEqual([3, 4], [t["extra"]["id"] for t in self.tm.get_tasks(1)])
+        self.assertEqual(4, self.tm.get_task(4, 1).task_id)
+        self.assertRaises(TaskIdDoesNotExistException, self.tm.get_task, 2, 1)
+        self.assertRaises(TaskIdDoesNotExistException, self.tm.get_task, 3, 0)
+
+    def test_task_pages(self):
+        for _ in range(5):
+            self.add_reminder(1, "1h")
+        page = self.tm.get_task_page(1, 2, 2)
+
+        self.assertEqual([4, 5], [t["extra"]["id"] for t in page["tasks"]])
+        self.assertEqual(5, page["total"])
+        self.assertEqual([], self.tm.get_task_page(1, 6, 2)["tasks"])
+        self.assertRaises(UserHasNoTasksException, self.tm.get_task_page, 2, 0, 2)
+
+    def test_add_tasks(self):
+        tasks = [self.reminder(1, f"{i}m") for i in range(1, 6)]
+        tasks.insert(2, self.reminder(1, "bad"))
+        errors = self.tm.add_tasks(tasks)
+
+        self.assertEqual([2], [i for i, _ in errors])
+        self.assertEqual(5, len(self.tm.get_tasks(1)))
+        self.assertEqual(6, len(self.tm.task_queue))
+        self.assertEqual(dt.now().replace(microsecond=0) + td(minutes=1), self.tm.next_date)
+
+    def test_delete_tasks(self):
+        self.tm.add_tasks([self.reminder(1, "1m"), self.reminder(1, "50h"), self.reminder(1, "2m")])
+        self.reload_with_horizon(24)
+        missing = self.tm.delete_tasks([2, 3, 1], 1)
+
+        self.assertEqual([1], missing)
+        self.assertEqual([4], [t["extra"]["id"] for t in self.tm.get_tasks(1)])
+        self.assertEqual(dt.now().replace(microsecond=0) + td(minutes=2), self.tm.next_date)
+
+    def test_same_schedule_shares_queue_entry(self):
+        self.tm.add_tasks([self.reminder(author_id, "0 8 * * *") for author_id in range(1, 101)])
+
+        self.assertEqual(101, len(self.tm.task_queue))
+        self.assertEqual(2, self.tm.task_queue.buckets())
+
+        for task in list(self.tm.loaded.values())[1:]:
+            task._next_time = dt.now() - td(seconds=1)
+            self.tm.queue_task(task)
+        self.tm.set_next_date()
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(100, len(executed))
+        self.assertEqual(2, self.tm.task_queue.buckets())
+
+    def test_spread_dispatch_times(self):
+        self.tm.spread = 30
+        self.tm.add_tasks([self.reminder(author_id, "0 8 * * *") for author_id in range(1, 101)])
+        tasks = list(self.tm.loaded.values())[1:]
+        offsets = [self.tm.dispatch_time(task) - task.next_time for task in tasks]
+
+        self.assertTrue(all(td(0) <= offset <= td(seconds=30) for offset in offsets))
+        self.assertTrue(len(set(offsets)) > 10)
+        self.assertEqual(offsets, [self.tm.dispatch_time(task) - task.next_time for task in tasks])
+
+    def test_spread_task_within_window_executed(self):
+        self.tm.spread = 30
+        self.tm.catch_up = CatchUp.SKIP
+        self.tm.add_tasks([self.reminder(1, "0 8 * * *") for _ in range(20)])
+        # a task dispatched later than the date window after its date
+        task = max(self.tm.loaded.values(), key=lambda t: self.tm.dispatch_time(t) - t.next_time)
+        offset = self.tm.dispatch_time(task) - task.next_time
+        self.assertTrue(offset > self.tm.date_window)
+        task._next_time = dt.now() - offset
+        self.tm.queue_task(task)
+        self.tm.set_next_date()
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(1, len(executed))
+
+    def test_shutdown_not_spread(self):
+        self.tm.spread = 30
+        tsk = self.tm.create_task("Shutdown", {"author_id": 0, "date_string": "0 8 * * *", "mode": "shutdown"})
+
+        self.assertEqual(tsk.next_time, self.tm.dispatch_time(tsk))
+
+    def test_privileged_author_lane(self):
+        self.tm.privileged = {1}
+        self.tm.add_tasks([self.reminder(1, "1m"), self.reminder(2, "1m")])
+
+        self.assertEqual(1, len(self.tm.task_queue.queues[Priority.PRIVILEGED]))
+        self.assertEqual(2, len(self.tm.task_queue.queues[Priority.USER]))
+        self.assertEqual(Priority.PRIVILEGED, self.tm.task_priority(self.tm.loaded[2]))
+
+    def test_system_tasks_dispatched_first(self):
+        self.tm.budgets[Priority.USER] = 10
+        self.tm.add_tasks([self.reminder(author_id, "0 8 * * *") for author_id in range(1, 31)])
+        shutdown = self.tm.create_task("Shutdown", {"author_id": 0, "date_string": "0 8 * * *", "mode": "shutdown"})
+        self.tm.save_task(shutdown)
+        self.tm.map_task(shutdown)
+        for task in list(self.tm.loaded.values())[1:]:
+            task._next_time = dt.now() - td(seconds=1)
+            self.tm.queue_task(task)
+        self.tm.set_next_date()
+        executed = self.collect_executions()
+        self.tm.tasks_loop()
+
+        self.assertEqual(11, len(executed))
+        self.assertIs(shutdown, executed[0])
+        self.assertEqual(20, len([t for t in self.tm.task_queue.items() if t.next_time <= dt.now()]))
+        self.assertTrue(self.tm.next_date <= dt.now())
+
+        self.tm.tasks_loop()
+        self.tm.tasks_loop()
+        self.assertEqual(31, len(executed))
+
+    def test_full_user_lane_does_not_delay_system_tasks(self):
+        release = Event()
+        pool = ExecutorPool(self.ipc, workers=1, queue_size=1, timeout=60)
+        self.tm.executors[Priority.USER] = pool
+        pool.submit(DummyTask(release))
+        while pool.busy == 0:
+            time.sleep(0.01)
+        self.assertTrue(pool.submit(DummyTask(release)))
+        self.assertFalse(pool.submit(DummyTask(release)))
+
+        self.tm.add_tasks([self.reminder(author_id, "0 8 * * *") for author_id in range(1, 6)])
+        shutdown = self.tm.create_task("Shutdown", {"author_id": 0, "date_string": "0 8 * * *", "mode": "shutdown"})
+        self.tm.save_task(shutdown)
+        self.tm.map_task(shutdown)
+        for task in self.tm.loaded.values():
+            task._next_time = dt.now() - td(seconds=1)
+            self.tm.queue_task(task)
+        self.tm.set_next_date()
+        user = len(self.tm.task_queue.queues[Priority.USER])
+        system = []
+        self.tm.executors[Priority.SYSTEM].submit = lambda tsk, scheduled: system.append(tsk) or True
+        start = time.monotonic()
+        try:
+            self.tm.tasks_loop()
+
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual([shutdown], system)
+            self.assertEqual(user, len([t for t in self.tm.task_queue.items() if t.next_time <= dt.now()]))
+            self.assertTrue(self.tm.saturated)
+            self.assertGreaterEqual(self.tm.time_to_next_date(), 0.1)
+
+            release.set()
+            for _ in range(100):
+                if pool.executed == user + 2:
+                    break
+                self.tm.tasks_loop()
+                time.sleep(0.05)
+            self.assertEqual(user + 2, pool.executed)
+            self.assertFalse(self.tm.saturated)
+        finally:
+            release.set()
+            pool.stop(1)
+
+    def test_author_quota(self):
+        self.tm.quota.limits["author"] = (3, 0)
+        errors = self.tm.add_tasks([self.reminder(1, f"{i}m") for i in range(1, 5)])
+
+        self.assertEqual([3], [i for i, _ in errors])
+        self.assertRaises(TaskCreationError, self.add_reminder, 1, "6m")
+
+        self.tm.delete_tasks([2], 1)
+        self.assertEqual([], self.tm.add_tasks([self.reminder(1, "5m")]))
+
+    def test_repeated_ids_deleted_once(self):
+        self.tm.add_tasks([self.reminder(1, "1h"), self.reminder(1, "1h")])
+        task_id = max(self.tm.tasks[1])
+
+        self.assertEqual([], self.tm.delete_tasks([task_id, task_id], 1))
+        self.assertEqual([1, 24.0], self.tm.quota.usage[("author", 1)])
+
+    def test_daily_execution_quota(self):
+        self.tm.quota.limits["author"] = (0, 48)
+        errors = self.tm.add_tasks([self.reminder(1, "1h"), self.reminder(1, "1h"), self.reminder(1, "0 8 * * *")])
+
+        self.assertEqual([2], [i for i, _ in errors])
+
+    def test_quota_counted_on_load(self):
+        self.tm.add_tasks([self.reminder(1, "1m"), self.reminder(1, "50h")])
+        self.reload_with_horizon(24)
+
+        self.assertEqual(2, self.tm.quota.usage[("author", 1)][0])
+        self.tm.delete_all_tasks(1)
+        self.assertFalse(("author", 1) in self.tm.quota.usage)
+
+    def test_fan_out_reminder_saved_once(self):
+        kwargs = dict(self.reminder(1, "0 8 * * *")["kwargs"], user_ids=list(range(100, 200)), server_id=5)
+        errors = self.tm.add_tasks([{"task": "FanOutReminder", "kwargs": kwargs},
+                                    {"task": "FanOutReminder", "kwargs": self.reminder(1, "1m")["kwargs"]}])
+
+        self.assertEqual([1], [i for i, _ in errors])
+        self.assertEqual(2, len(self.tm.task_queue))
+        self.reload_with_horizon(24)
+        tsk = self.tm.get_task(2, 1)
+        self.assertEqual(("fan_out", "test", "", {"user_ids": list(range(100, 200)), "role_id": None, "server_id": 5}),
+                         tsk.run())
+        self.assertEqual(1, self.tm.quota.usage[("author", 1)][0])
+
+    def test_purge_tasks(self):
+        tasks = [self.reminder(1, "1m"), self.reminder(2, "50h"), self.reminder(2, "2m")]
+        for t, channel_id in zip(tasks, [5, 5, 6]):
+            t["kwargs"].update(channel_id=channel_id, server_id=9)
+        self.tm.add_tasks(tasks)
+        self.reload_with_horizon(24)
+
+        self.assertEqual(2, self.tm.purge_tasks("channel_id", [5]))
+        self.assertEqual([4], list(self.tm.tasks[2]))
+        self.assertEqual(1, self.tm.store.author_count(2))
+        self.assertEqual(2, len(self.tm.task_queue))
+        self.assertEqual(1, self.tm.purge_tasks("server_id", [9, 10]))
+        self.assertEqual(1, self.tm.purge_tasks("type", ["Reminder"]))
+        self.assertTrue(self.tm.task_queue.empty())
+        self.assertEqual({}, self.tm.quota.usage)
+
+    def test_executions_in_history(self):
+        task = self.tm.loaded[1]
+        scheduled = dt.now().replace(microsecond=0) - td(seconds=1)
+        task._next_time = scheduled
+        self.tm.queue_task(task)
+        self.tm.set_next_date()
+        self.tm.tasks_loop()
+        for executor in self.tm.executors.values():
+            executor.stop(1)
+
+        self.assertTrue(self.tm.history_pending())
+        executions = self.tm.history.query(0, task_id=1)
+        self.assertEqual(1, len(executions))
+        self.assertEqual(scheduled, executions[0]["scheduled"])
+        self.assertEqual("ok", executions[0]["outcome"])
+        self.assertFalse(self.tm.history_pending())
@@ -0,0 +1,220 @@
+import random
+from unittest import TestCase
+from datetime import datetime as dt, timedelta as td
+from core.task.task_queue import TaskHeap, TimingWheel, BucketQueue, LaneQueue
+
+
+class TaskHeapTests(TestCase):
+    heap: TaskHeap
+
+    def setUp(self) -> None:
+        random.seed(1)
+        self.heap = TaskHeap()
+
+    def pop_all(self) -> list:
+        items = []
+        while not self.heap.empty():
+            items.append(self.heap.pop())
+        return items
+
+    def test_pop_order(self):
+        keys = {i: random.randint(0, 1000) for i in range(500)}
+        for item, key in keys.items():
+            self.heap.push(item, key)
+
+        self.assertEqual(sorted(keys, key=lambda i: (keys[i], i)), self.pop_all())
+
+    def test_equal_keys_keep_insertion_order(self):
+        for item in ["a", "b", "c"]:
+            self.heap.push(item, 1)
+
+        self.assertEqual(["a", "b", "c"], self.pop_all())
+
+    def test_peek(self):
+        self.heap.push("a", 5)
+        self.heap.push("b", 3)
+
+        self.assertEqual("b", self.heap.peek())
+        self.assertEqual(3, self.heap.peek_key())
+        self.assertEqual(2, len(self.heap))
+
+    def test_order_after_arbitrary_removes(self):
+        keys = {i: random.randint(0, 1000) for i in range(500)}
+        for item, key in keys.items():
+            self.heap.push(item, key)
+        for item in random.sample(list(keys), 250):
+            self.heap.remove(item)
+            del keys[item]
+
+        self.assertEqual(sorted(keys, key=lambda i: (keys[i], i)), self.pop_all())
+
+    def test_order_after_arbitrary_updates(self):
+        keys = {i: random.randint(0, 1000) for i in range(500)}
+        for item, key in keys.items():
+            self.heap.push(item, key)
+        for item in random.sample(list(keys), 250):
+            keys[item] = random.randint(0, 1000)
+            self.heap.update(item, keys[item])
+
+        popped = self.pop_all()
+        self.assertEqual(sorted(keys.values()), [keys[i] for i in popped])
+
+    def test_remove_and_contains(self):
+        self.heap.push("a", 1)
+        self.heap.push("b", 2)
+        self.heap.remove("a")
+
+        self.assertNotIn("a", self.heap)
+        self.assertIn("b", self.heap)
+        self.assertEqual("b", self.heap.pop())
+        self.assertTrue(self.heap.empty())
+
+    def test_push_twice(self):
+        self.heap.push("a", 1)
+
+        self.assertRaises(KeyError, self.heap.push, "a", 2)
+
+    def test_push_many(self):
+        keys = {i: random.randint(0, 1000) for i in range(500)}
+        self.heap.push_many(list(keys.items())[:10])
+        self.heap.push_many(list(keys.items())[10:])
+        self.heap.remove(20)
+        del keys[20]
+
+        self.assertEqual(sorted(keys, key=lambda i: (keys[i], i)), self.pop_all())
+
+
+class TimingWheelTests(TestCase):
+    wheel: TimingWheel
+
+    def setUp(self) -> None:
+        random.seed(1)
+        self.wheel = TimingWheel()
+        self.start = dt.now().replace(microsecond=0)
+
+    def key(self, seconds: int) -> tuple:
+        return self.start + td(seconds=seconds), self.start
+
+    def pop_all(self) -> list:
+        items = []
+        while not self.wheel.empty():
+            items.append(self.wheel.pop())
+        return items
+
+    def test_pop_order(self):
+        seconds = {i: random.randint(0, 100) for i in range(500)}
+        for item, second in seconds.items():
+            self.wheel.push(item, self.key(second))
+
+        self.assertEqual(sorted(seconds, key=lambda i: (seconds[i], i)), self.pop_all())
+
+    def test_order_after_arbitrary_removes(self):
+        seconds = {i: random.randint(0, 100) for i in range(500)}
+        for item, second in seconds.items():
+            self.wheel.push(item, self.key(second))
+        for item in random.sample(list(seconds), 250):
+            self.wheel.remove(item)
+            del seconds[item]
+
+        self.assertEqual(sorted(seconds, key=lambda i: (seconds[i], i)), self.pop_all())
+
+    def test_reuse_emptied_slot(self):
+        self.wheel.push("a", self.key(5))
+        self.wheel.remove("a")
+        self.wheel.push("b", self.key(10))
+        self.wheel.push("a", self.key(5))
+
+        self.assertEqual(self.key(5), self.wheel.peek_key())
+        self.assertEqual(["a", "b"], self.pop_all())
+
+    def test_update(self):
+        self.wheel.push("a", self.key(5))
+        self.wheel.push("b", self.key(10))
+        self.wheel.update("a", self.key(20))
+
+        self.assertEqual(["b", "a"], self.pop_all())
+
+
+class BucketQueueTests(TestCase):
+    queue: BucketQueue
+
+    def setUp(self) -> None:
+        random.seed(1)
+        # items are grouped by their first letter
+        self.queue = BucketQueue(TaskHeap(), lambda item: item[0])
+        self.start = dt.now().replace(microsecond=0)
+
+    def key(self, seconds: int) -> tuple:
+        return self.start + td(seconds=seconds), self.start
+
+    def test_same_group_and_date_share_an_entry(self):
+        for item in ["a1", "a2", "a3"]:
+            self.queue.push(item, self.key(5))
+        self.queue.push("b1", self.key(5))
+        self.queue.push("a4", self.key(6))
+
+        self.assertEqual(5, len(self.queue))
+        self.assertEqual(3, self.queue.buckets())
+        self.assertEqual(["a1", "a2", "a3"], self.queue.pop_group())
+        self.assertEqual(["b1"], self.queue.pop_group())
+        self.assertEqual(self.key(6), self.queue.peek_key())
+
+    def test_remove_and_update(self):
+        for item in ["a1", "a2", "b1"]:
+            self.queue.push(item, self.key(5))
+        self.queue.remove("a1")
+        self.queue.update("a2", self.key(1))
+        self.queue.remove("b1")
+
+        self.assertNotIn("a1", self.queue)
+        self.assertEqual(1, self.queue.buckets())
+        self.assertEqual("a2", self.queue.pop())
+        self.assertTrue(self.queue.empty())
+
+    def test_pop_order(self):
+        seconds = {f"{random.choice('abc')}{i}": random.randint(0, 20) for i in range(500)}
+        self.queue.push_many([(item, self.key(second)) for item, second in seconds.items()])
+        popped = []
+        while not self.queue.empty():
+            popped += self.queue.pop_group()
+
+        self.assertEqual(sorted(seconds.values()), [seconds[i] for i in popped])
+
+    def test_pop_group_limit(self):
+        for item in ["a1", "a2", "a3"]:
+            self.queue.push(item, self.key(5))
+        self.queue.push("b1", self.key(6))
+
+        self.assertEqual(["a1", "a2"], self.queue.pop_group(2))
+        self.assertEqual(2, len(self.queue))
+        self.assertEqual(self.key(5), self.queue.peek_key())
+        self.assertEqual(["a3"], self.queue.pop_group(2))
+        self.assertEqual(["b1"], self.queue.pop_group())
+
+
+class LaneQueueTests(TestCase):
+    queue: LaneQueue
+
+    def setUp(self) -> None:
+        # items are put into the lane of their first letter and grouped by their second
+        self.queue = LaneQueue({lane: BucketQueue(TaskHeap(), lambda item: item[1]) for lane in "ab"},
+                               lambda item: item[0])
+        self.start = dt.now().replace(microsecond=0)
+
+    def key(self, seconds: int) -> tuple:
+        return self.start + td(seconds=seconds), self.start
+
+    def test_items_in_their_lane(self):
+        self.queue.push_many([("ax1", self.key(3)), ("bx1", self.key(1)), ("ax2", self.key(3))])
+        self.queue.push("by1", self.key(2))
+
+        self.assertEqual(4, len(self.queue))
+        self.assertEqual(3, self.queue.buckets())
+        self.assertEqual(["ax1", "ax2"], self.queue.queues["a"].items())
+        self.assertEqual(self.key(1), self.queue.peek_key())
+        self.assertTrue("by1" in self.queue)
+
+        self.queue.remove("bx1")
+        self.queue.update("by1", self.key(4))
+        self.assertEqual(self.key(3), self.queue.peek_key())
+        self.assertEqual(["by1"], self.queue.queues["b"].pop_group())
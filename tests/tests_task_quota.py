@@ -0,0 +1,40 @@
+from unittest import TestCase
+from core.task.task_quota import TaskQuota
+from core.task.task_exceptions import QuotaExceededError, TaskCreationError
+
+
+class TaskQuotaTests(TestCase):
+
+    def test_task_limit(self):
+        quota = TaskQuota(max_tasks=2)
+        quota.add(1, None, 1)
+        quota.check(1, None, 1)
+        quota.add(1, None, 1)
+
+        self.assertRaises(QuotaExceededError, quota.check, 1, None, 1)
+        quota.check(2, None, 1)
+        quota.remove(1, None, 1)
+        quota.check(1, None, 1)
+
+    def test_execution_limit(self):
+        quota = TaskQuota(max_fires=100)
+        quota.add(1, None, 96)
+
+        quota.check(1, None, 4)
+        self.assertRaises(QuotaExceededError, quota.check, 1, None, 5)
+
+    def test_server_limit(self):
+        quota = TaskQuota(max_server_tasks=2)
+        quota.add(1, 10, 1)
+        quota.add(2, 10, 1)
+
+        self.assertRaises(TaskCreationError, quota.check, 3, 10, 1)
+        quota.check(3, 11, 1)
+        quota.check(1, None, 1)
+
+    def test_emptied_usage_removed(self):
+        quota = TaskQuota()
+        quota.add(1, 10, 24)
+        quota.remove(1, 10, 24)
+
+        self.assertEqual({}, quota.usage)
@@ -0,0 +1,36 @@
+from unittest import TestCase
+from core.task.task_stats import Histogram, RateCounter
+
+
+class HistogramTests(TestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram(smallest=1, factor=2, buckets=10)
+        for value in range(1, 101):
+            histogram.record(value)
+
+        self.assertEqual(64, histogram.percentile(50))
+        self.assertEqual(100, histogram.percentile(99))
+        self.assertEqual(50.5, histogram.mean())
+        self.assertEqual(100, histogram.max)
+
+    def test_values_above_all_bounds(self):
+        histogram = Histogram(smallest=1, factor=2, buckets=3)
+        histogram.record(1000)
+
+        self.assertEqual(1000, histogram.percentile(50))
+        self.assertEqual([0, 0, 0, 1], histogram.counts)
+
+    def test_empty(self):
+        self.assertEqual({"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0},
+                         Histogram().summary())
+
+
+class RateCounterTests(TestCase):
+
+    def test_rate(self):
+        counter = RateCounter(seconds=10)
+        counter.add(20)
+        counter.add(10)
+
+        self.assertEqual(3, counter.rate())
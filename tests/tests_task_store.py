@@ -0,0 +1,338 @@
+import os
+import shutil
+import tempfile
+import json
+import sqlite3
+from unittest import TestCase
+from datetime import datetime as dt
+from core.task.task_store import TaskJournal, TaskDatabase
+from core.task.task_record import RECORD_VERSION, to_epoch, from_epoch
+from core.database import Data
+
+
+def make_record(task_id, author_id=0) -> dict:
+    return {"version": RECORD_VERSION,
+            "basic": {"author_id": author_id},
+            "extra": {"id": task_id,
+                      "type": "Reminder",
+                      "creation_time": to_epoch(dt(2021, 1, 25, 5, 20, 0, 123456)),
+                      "next_time": to_epoch(dt(2030, 1, 1)),
+                      "delete": False,
+                      "counter": -1}}
+
+
+def make_old_record(task_id, author_id=0) -> dict:
+    return {"basic": {"author_id": author_id},
+            "extra": {"id": task_id,
+                      "type": "Reminder",
+                      "creation_time": "25.01.21 05:20:00:123456",
+                      "next_time": "01.01.30 00:00:00",
+                      "delete": False,
+                      "counter": -1}}
+
+
+def make_usage_records() -> list:
+    records = [make_record(1, author_id=1), make_record(2, author_id=1), make_record(3, author_id=2)]
+    for record, date_string in zip(records, ["1h", "1h", "0 8 * * *"]):
+        record["basic"]["date_string"] = date_string
+    records[0]["basic"]["server_id"] = 10
+    records[1]["basic"]["server_id"] = 10
+    return records
+
+
+USAGE = {("author", 1): [1, 24.0], ("server", 10): [1, 24.0], ("author", 2): [1, 1.0]}
+
+
+class TaskJournalTests(TestCase):
+    data: Data
+    store: TaskJournal
+
+    def setUp(self) -> None:
+        self.data = Data(tempfile.mkdtemp())
+        self.store = TaskJournal(self.data, file="tasks_test")
+        self.store.clear()
+
+    def tearDown(self) -> None:
+        self.store.clear()
+        self.store.close()
+        shutil.rmtree(self.data.path)
+
+    def reload(self) -> dict:
+        # a new journal simulates a restart without compaction, like after a crash
+        store = TaskJournal(self.data, file="tasks_test")
+        return {r["extra"]["id"]: r for r in store.load()}
+
+    def test_changes_survive_restart(self):
+        self.store.add(make_record(1))
+        self.store.add(make_record(2))
+        self.store.update(1, next_time=to_epoch(dt(2030, 1, 2, 0, 0, 0, 500)), counter=3)
+        self.store.delete(2)
+        records = self.reload()
+
+        self.assertEqual([1], list(records.keys()))
+        self.assertEqual(dt(2030, 1, 2, 0, 0, 0, 500), from_epoch(records[1]["extra"]["next_time"]))
+        self.assertEqual(3, records[1]["extra"]["counter"])
+
+    def test_change_writes_one_line(self):
+        for i in range(10):
+            self.store.add(make_record(i))
+        self.store.update(3, counter=1)
+        with open(self.store.journal_path) as f:
+            lines = f.readlines()
+
+        self.assertEqual(11, len(lines))
+
+    def test_compaction(self):
+        self.store.compact_after = 5
+        for i in range(5):
+            self.store.add(make_record(i))
+        with open(self.store.journal_path) as f:
+            self.assertEqual("", f.read())
+
+        self.assertEqual(5, len(self.reload()))
+
+    def test_batch_writes_once(self):
+        self.store.add(make_record(1))
+        self.store.add_many([make_record(i) for i in range(2, 6)])
+        self.store.delete_many([2, 3, 7])
+        with open(self.store.journal_path) as f:
+            lines = f.readlines()
+
+        self.assertEqual(7, len(lines))
+        self.assertEqual([1, 4, 5], sorted(self.reload().keys()))
+
+    def test_large_batch_compacts(self):
+        self.store.compact_after = 5
+        self.store.add_many([make_record(i) for i in range(1, 11)])
+        with open(self.store.journal_path) as f:
+            self.assertEqual("", f.read())
+
+        self.assertEqual(10, len(self.reload()))
+
+    def test_incomplete_line_ignored(self):
+        self.store.add(make_record(1))
+        self.store.close()
+        with open(self.store.journal_path, "a") as f:
+            f.write('{"op": "delete", "i')
+
+        self.assertEqual([1], list(self.reload().keys()))
+
+    def test_tasks_without_id_get_one(self):
+        old = [make_record(None), make_record(None)]
+        for r in old:
+            del r["extra"]["id"]
+        self.store.close()
+        with open(self.store.snapshot_path, "w") as f:
+            json.dump(old, f)
+        records = self.store.load()
+
+        self.assertEqual([1, 2], sorted(r["extra"]["id"] for r in records))
+        self.assertEqual(3, self.store.next_id())
+
+    def test_records_kept_as_json(self):
+        self.store.add(make_record(1))
+        self.store.get(1)["extra"]["counter"] = 5
+
+        self.assertIsInstance(self.store.records[1], str)
+        self.assertEqual(make_record(1), self.store.get(1))
+        self.assertEqual(1, self.store.indexes["type"]["Reminder"])
+
+    def test_ids_not_given_again(self):
+        for _ in range(3):
+            self.store.add(make_record(self.store.next_id()))
+        self.store.delete(3)
+
+        store = TaskJournal(self.data, file="tasks_test")
+        store.load()
+        self.assertEqual(4, store.next_id())
+        store.compact()
+        store.load()
+        self.assertEqual(5, store.next_id())
+
+    def test_author_pages(self):
+        for i in range(1, 8):
+            self.store.add(make_record(i, author_id=i % 2))
+        self.store.delete(3)
+
+        self.assertEqual([5, 7], [r["extra"]["id"] for r in self.store.author_records(1, offset=1, limit=2)])
+        self.assertEqual([], self.store.author_records(1, offset=3, limit=2))
+        self.assertEqual(3, self.store.author_count(1))
+
+    def test_indexed_records(self):
+        for i in range(1, 7):
+            record = make_record(i)
+            record["basic"].update(channel_id=i % 3, server_id=10)
+            self.store.add(record)
+        self.store.delete(4)
+        self.store.load()
+
+        self.assertEqual([1], [r["extra"]["id"] for r in self.store.indexed_records("channel_id", 1)])
+        self.assertEqual(5, len(self.store.indexed_records("server_id", 10)))
+        self.assertEqual(5, len(self.store.indexed_records("type", "Reminder")))
+        self.store.delete_many([1])
+        self.assertFalse(1 in self.store.indexes["channel_id"])
+
+    def test_usage_counted(self):
+        records = make_usage_records()
+        self.store.add_many(records)
+        self.store.add(records[0])
+        self.store.delete(2)
+
+        self.assertEqual(USAGE, self.store.usage())
+        self.store.load()
+        self.assertEqual(USAGE, self.store.usage())
+
+    def test_old_tasks_are_migrated(self):
+        self.store.close()
+        with open(self.store.snapshot_path, "w") as f:
+            json.dump([make_old_record(1)], f)
+        with open(self.store.journal_path, "w") as f:
+            f.write(json.dumps({"op": "update", "id": 1, "extra": {"next_time": "02.01.30 00:00:00"}}) + "\n")
+        self.store.load()
+        with open(self.store.snapshot_path) as f:
+            record = json.load(f)["tasks"][0]
+
+        self.assertEqual(RECORD_VERSION, record["version"])
+        self.assertEqual(dt(2021, 1, 25, 5, 20, 0, 123456), from_epoch(record["extra"]["creation_time"]))
+        self.assertEqual(dt(2030, 1, 2), from_epoch(record["extra"]["next_time"]))
+
+
+class TaskDatabaseTests(TestCase):
+    data: Data
+    store: TaskDatabase
+
+    def setUp(self) -> None:
+        self.data = Data(tempfile.mkdtemp())
+        self.store = TaskDatabase(self.data, file="tasks_test")
+        self.store.clear()
+        self.remove_json()
+
+    def tearDown(self) -> None:
+        self.store.clear()
+        self.store.close()
+        self.remove_json()
+        shutil.rmtree(self.data.path)
+
+    def remove_json(self):
+        journal = TaskJournal(self.data, file="tasks_test")
+        for path in [journal.snapshot_path, journal.journal_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def reload(self) -> dict:
+        self.store.close()
+        store = TaskDatabase(self.data, file="tasks_test")
+        records = {r["extra"]["id"]: r for r in store.load()}
+        store.close()
+        return records
+
+    def test_changes_survive_restart(self):
+        self.store.add(make_record(1))
+        self.store.add(make_record(2))
+        self.store.update(1, next_time=to_epoch(dt(2030, 1, 2, 0, 0, 0, 500)), counter=3)
+        self.store.delete(2)
+        records = self.reload()
+
+        self.assertEqual([1], list(records.keys()))
+        self.assertEqual(dt(2030, 1, 2, 0, 0, 0, 500), from_epoch(records[1]["extra"]["next_time"]))
+        self.assertEqual(3, records[1]["extra"]["counter"])
+
+    def test_load_in_chunks(self):
+        self.store.chunk_size = 3
+        for i in range(1, 11):
+            self.store.add(make_record(i))
+        records = list(self.store.load())
+
+        self.assertEqual(list(range(1, 11)), [r["extra"]["id"] for r in records])
+        self.assertEqual(11, self.store.next_id())
+
+    def test_ids_not_given_again(self):
+        for _ in range(3):
+            self.store.add(make_record(self.store.next_id()))
+        self.store.delete(3)
+        self.store.close()
+
+        store = TaskDatabase(self.data, file="tasks_test")
+        store.load()
+        self.assertEqual(4, store.next_id())
+        store.close()
+
+    def test_author_records(self):
+        for i in range(1, 7):
+            self.store.add(make_record(i, author_id=i % 2))
+
+        self.assertEqual([1, 3, 5], [r["extra"]["id"] for r in self.store.author_records(1)])
+        self.assertEqual([3], [r["extra"]["id"] for r in self.store.author_records(1, offset=1, limit=1)])
+        self.assertEqual(3, self.store.author_count(1))
+        plan = self.store.connect().execute("EXPLAIN QUERY PLAN SELECT record FROM tasks WHERE author_id = 1")
+        self.assertIn("tasks_author_id", str(plan.fetchall()))
+
+    def test_indexed_records(self):
+        for i in range(1, 7):
+            record = make_record(i)
+            record["basic"].update(channel_id=i % 3, server_id=10)
+            self.store.add(record)
+        self.store.delete(4)
+
+        self.assertEqual([1], [r["extra"]["id"] for r in self.store.indexed_records("channel_id", 1)])
+        self.assertEqual(5, len(self.store.indexed_records("server_id", 10)))
+        self.assertEqual(5, len(self.store.indexed_records("type", "Reminder")))
+        plan = self.store.connect().execute("EXPLAIN QUERY PLAN SELECT record FROM tasks "
+                                            "WHERE json_extract(record, '$.basic.channel_id') = 1")
+        self.assertIn("tasks_channel_id", str(plan.fetchall()))
+
+    def test_import_json(self):
+        journal = TaskJournal(self.data, file="tasks_test")
+        journal.add(make_record(1))
+        journal.add(make_record(2))
+        journal.add(make_record(3))
+        journal.delete(3)
+        journal.close()
+
+        self.assertEqual([1, 2], list(self.reload().keys()))
+        self.store.load()
+        self.assertEqual(4, self.store.next_id())
+
+    def test_json_imported_once(self):
+        journal = TaskJournal(self.data, file="tasks_test")
+        journal.add(make_record(1))
+        journal.close()
+        self.store.load()
+        self.store.delete_many([1])
+
+        self.assertEqual({}, self.reload())
+
+    def test_usage_counted(self):
+        records = make_usage_records()
+        self.store.add_many(records)
+        self.store.add(records[0])
+        self.store.delete(2)
+        self.store.close()
+
+        self.assertEqual(USAGE, TaskDatabase(self.data, file="tasks_test").usage())
+
+    def test_usage_of_old_database(self):
+        self.store.close()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.store.path + suffix):
+                os.remove(self.store.path + suffix)
+        connection = sqlite3.connect(self.store.path)
+        connection.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, author_id INTEGER NOT NULL, "
+                           "next_time REAL NOT NULL, record TEXT NOT NULL)")
+        connection.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?)",
+                               [(r["extra"]["id"], r["basic"]["author_id"], 0, json.dumps(r))
+                                for r in make_usage_records() if r["extra"]["id"] != 2])
+        connection.commit()
+        connection.close()
+
+        self.assertEqual(USAGE, self.store.usage())
+        self.store.delete(1)
+        self.assertEqual({("author", 2): [1, 1.0]}, self.store.usage())
+
+    def test_old_rows_are_migrated(self):
+        old = make_old_record(1)
+        self.store.add(make_record(1))
+        with self.store.connect() as connection:
+            connection.execute("UPDATE tasks SET record = ? WHERE id = 1", (json.dumps(old),))
+
+        self.assertEqual(make_record(1), self.store.get(1))